@@ -1,8 +1,18 @@
-from flask import Flask, render_template, jsonify, request, session
-import pandas as pd
+from flask import Flask, render_template, jsonify, request, session, Response, stream_with_context
+import argparse
+import atexit
+import contextlib
+import importlib
+import logging
+import logging.handlers
+import mmap
 import json
+import queue
 import re
 import os
+import shutil
+import signal
+import socket
 import sys
 import threading
 import time
@@ -11,20 +21,202 @@ from pathlib import Path
 from urllib.parse import quote
 from werkzeug.utils import secure_filename
 import io
+import csv
+import codecs
 import uuid
+import hashlib
+import html
+import math
+import operator
+import tempfile
+from collections import OrderedDict, deque
+from collections.abc import Mapping
 from difflib import SequenceMatcher
 
+class LazyModule:
+    """首次访问属性时才导入的模块代理
+
+    pandas（连同NumPy、openpyxl）导入需要数秒，推迟到第一次解析文件时再导入，
+    让服务器先开始监听
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+pd = LazyModule('pandas')
+np = LazyModule('numpy')
+
+class RingBufferHandler(logging.Handler):
+    """在内存中保留最近的日志记录，供 /api/debug/log 查看"""
+
+    def __init__(self, capacity):
+        super().__init__()
+        self.entries = deque(maxlen=capacity)
+        self.sequence = 0
+
+    def emit(self, record):
+        self.sequence += 1
+        self.entries.append({
+            'id': self.sequence,
+            'time': record.created,
+            'level': record.levelname,
+            'levelno': record.levelno,
+            'logger': record.name,
+            'message': record.getMessage()
+        })
+
+    def snapshot(self, since=0, min_level=logging.DEBUG, source=None, limit=None):
+        """返回编号大于 since 且不低于 min_level 的记录，source 为日志来源（如 ingestion）"""
+        with self.lock:
+            entries = [entry for entry in self.entries
+                       if entry['id'] > since and entry['levelno'] >= min_level and
+                       (source is None or entry['logger'].endswith('.' + source))]
+        return entries[-limit:] if limit else entries
+
+# 日志只在业务线程中放入队列，由后台线程写控制台和内存环形缓冲区，解析过程不会阻塞在输出上
+LOG_RING_SIZE = 2000      # 内存中保留的日志条数
+ROW_LOG_SAMPLE_SIZE = 5   # 逐个社区的日志只保留的样本数
+
+logger = logging.getLogger('community_map')
+logger.setLevel(logging.DEBUG)
+logger.propagate = False
+ingestion_logger = logger.getChild('ingestion')  # 解析文件过程中的诊断信息
+
+log_queue = queue.Queue()
+log_ring_handler = RingBufferHandler(LOG_RING_SIZE)
+# 打包为无控制台窗口的exe时没有标准输出，只保留内存中的日志
+log_console_handler = logging.StreamHandler(sys.stdout) if sys.stdout is not None else logging.NullHandler()
+log_console_handler.setLevel(logging.INFO)
+log_console_handler.setFormatter(logging.Formatter('[%(levelname)s] %(message)s'))
+logger.addHandler(logging.handlers.QueueHandler(log_queue))
+log_listener = logging.handlers.QueueListener(log_queue, log_console_handler, log_ring_handler,
+                                              respect_handler_level=True)
+log_listener.start()
+atexit.register(log_listener.stop)
+
 app = Flask(__name__)
 app.secret_key = str(uuid.uuid4())  # 用于session管理
 
+# 服务端口
+SERVER_PORT = 5001
+
+# 解析文件用到的重型依赖，启动后在后台预加载
+INGESTION_MODULES = ['pandas', 'openpyxl']
+
 # 配置文件处理 - 使用内存模式避免Windows路径问题
-ALLOWED_EXTENSIONS = {'xlsx', 'xls'}
+ALLOWED_EXTENSIONS = {'xlsx', 'xls', 'csv', 'tsv'}
+DELIMITED_EXTENSIONS = {'csv', 'tsv'}  # 按分隔文本解析的扩展名
 app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB
 
 # 全局变量存储当前文件数据
 current_file_data = None  # 存储文件数据在内存中
 current_filename = None   # 存储原始文件名
-community_data_cache = {}  # 缓存处理后的数据
+current_dataset = None    # 当前发布的数据集（解析结果及版本号）
+dataset_version = 0       # 数据集版本号，每发布一份新内容加1
+dataset_history = OrderedDict()  # 最近几个版本的社区数据，用于计算增量
+dataset_changes_cache = {}  # 缓存 (起始版本, 当前版本) 的增量结果
+cache_lock = threading.Lock()
+reconciliation_cache = {}  # 缓存地图社区与Excel社区的对照索引
+query_cache = OrderedDict()  # 缓存 (数据版本, 查询条件) 的查询结果
+history_lock = threading.Lock()
+history_index = None      # 磁盘上历史快照的索引，首次使用时加载
+history_name_index = {}   # 标准化社区名 -> [(快照序号, 行号)]
+history_arrays = {}       # 快照ID -> 人数矩阵（内存映射）
+chart_cache = OrderedDict()  # 缓存 (数据版本, 社区, 数据列, 图表类型, 最大值) 的SVG图表片段
+event_subscribers = []    # 每个SSE连接一个消息队列
+current_ingestion = None  # 正在解析的文件，供流式接口边解析边输出
+shared_store_directory = None    # 多进程模式下各进程共享数据集的目录，单进程模式为None
+shared_manifest_signature = None # 本进程最近一次读取的共享清单文件 (inode, 修改时间, 大小)
+shared_sync_lock = threading.Lock()
+event_lock = threading.Lock()
+
+# 保留用于计算增量的历史版本数
+MAX_RETAINED_VERSIONS = 10
+
+# 检测文本编码和列数时读取的样本大小
+DELIMITED_SAMPLE_BYTES = 64 * 1024
+
+# 导出时每次写出的行数
+EXPORT_CHUNK_ROWS = 500
+
+# 同一社区多行文本合并时最多列出的不同取值数
+MAX_MERGED_TEXT_VALUES = 5
+
+# 每个查询缓存的结果数上限
+MAX_CACHED_QUERIES = 100
+
+# 查询过滤条件，如"低保>50"、"特困>=1人"
+QUERY_FILTER_PATTERN = re.compile(r'^(.+?)\s*(>=|<=|!=|>|<|=)\s*(\d+)\s*人?$')
+QUERY_OPERATORS = {
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+    '=': operator.eq,
+    '!=': operator.ne
+}
+# 按合计人数排序/过滤时使用的列名
+TOTAL_COLUMN_NAME = '总人数'
+
+# 缓存的SVG图表片段数上限
+MAX_CACHED_CHARTS = 1000
+
+# 图表配色，与页面上的图例一致，避免与地图选中的绿色(#4CAF50)冲突
+CHART_COLORS = [
+    {'main': '#FF6B6B', 'dark': '#E74C3C'},  # 红色系
+    {'main': '#4ECDC4', 'dark': '#26A69A'},  # 青绿色系
+    {'main': '#45B7D1', 'dark': '#2196F3'},  # 蓝色系
+    {'main': '#96CEB4', 'dark': '#58D68D'},  # 薄荷绿系
+    {'main': '#FFEAA7', 'dark': '#F39C12'},  # 黄色系
+    {'main': '#DDA0DD', 'dark': '#BA68C8'},  # 紫色系
+    {'main': '#F8BBD0', 'dark': '#E91E63'},  # 粉色系
+    {'main': '#FFB74D', 'dark': '#FF9800'}   # 橙色系
+]
+# 图表片段尺寸（缩放为1时的像素），页面按同样的尺寸放置
+PIE_CHART_RADIUS = 30
+PIE_CHART_SIZE = 64
+BAR_CHART_MAX_HEIGHT = 50
+BAR_CHART_MIN_HEIGHT = 6
+BAR_CHART_BAR_WIDTH = 8
+BAR_CHART_BAR_SPACING = 2
+BAR_CHART_MIN_WIDTH = 120
+BAR_CHART_TOP = 64      # 基线以上的高度
+BAR_CHART_BOTTOM = 20   # 基线以下的高度（社区名称）
+
+# 监视目录：默认目录（相对于程序所在目录）、轮询间隔和文件写入完成的判定时间（秒）
+DEFAULT_WATCH_DIRECTORY = 'uploads'
+WATCH_POLL_SECONDS = 2
+WATCH_DEBOUNCE_SECONDS = 3
+
+# 历史快照目录（相对于程序所在目录）及索引文件名
+HISTORY_DIRECTORY = 'history'
+HISTORY_INDEX_FILENAME = 'index.json'
+# 可通过 --history-dir 修改，设为None时不记录历史
+app.config['HISTORY_DIRECTORY'] = HISTORY_DIRECTORY
+
+# 多进程模式：共享目录中的清单和发布锁文件名、各进程检查新版本的间隔（秒）、直接输出共享JSON时的分块大小
+SHARED_MANIFEST_FILENAME = 'manifest.json'
+SHARED_LOCK_FILENAME = 'publish.lock'
+SHARED_POLL_SECONDS = 0.5
+WORKER_SHUTDOWN_SECONDS = 5  # 停止服务时等待工作进程退出的时间
+BACKGROUND_WORKER_INDEX = 'background'  # 运行目录监视等后台任务的子进程编号
+SHARED_RESPONSE_CHUNK_BYTES = 64 * 1024
+# 页面请求社区数据时使用的裁剪参数（与 index.html 中的 COMMUNITY_DATA_PROJECTION 一致），多进程模式下预先写入共享数据
+PAGE_PROJECTION = {'columns': None, 'fields': ['name', 'columns'], 'column_fields': ['raw_data', 'people_count']}
+
+# SSE心跳间隔（秒），防止代理或浏览器断开空闲连接
+SSE_HEARTBEAT_SECONDS = 15
+# 每个SSE连接最多积压的消息数，超过后丢弃（客户端收到下一条发布事件时会自行追上）
+SSE_QUEUE_SIZE = 100
+
+# 地图文件名
+MAP_SVG_FILENAME = '地图线稿.svg'
 
 # 列名映射配置
 COLUMN_MAPPINGS = {
@@ -37,13 +229,121 @@ COLUMN_MAPPINGS = {
     '身份证': ['身份证号', '身份证', '证件号', '身份证号码']
 }
 
+# 同一社区多行合并时按文本处理、不求和的字段
+NON_ADDITIVE_FIELDS = {'社区名', '姓名', '年龄', '性别', '电话', '身份证'}
+# 列名包含这些关键词的列（序号、编号等）同样不求和
+NON_ADDITIVE_COLUMN_KEYWORDS = ['序号', '编号', '行号']
+
 # 社区村名关键词
 COMMUNITY_KEYWORDS = ['社区', '村', '村委会', '居委会']
 
+# 社区名后缀的等价写法，统一为地图上使用的写法
+COMMUNITY_SUFFIX_ALIASES = [
+    ('村民委员会', '村'),
+    ('居民委员会', '社区'),
+    ('村委会', '村'),
+    ('居委会', '社区'),
+]
+
+# 社区名前面的街道/镇/乡前缀，如"海沧街道海达社区"
+ADMIN_PREFIX_PATTERN = re.compile(r'^[\u4e00-\u9fff]{2,}?(?:街道办事处|街道|镇|乡)')
+
+# n-gram相似度匹配的阈值
+NGRAM_MATCH_THRESHOLD = 0.5
+
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def is_delimited_file(filename):
+    """是否为CSV/TSV等分隔文本文件"""
+    return bool(filename) and '.' in filename and \
+           filename.rsplit('.', 1)[1].lower() in DELIMITED_EXTENSIONS
+
+def detect_text_encoding(file_data):
+    """检测分隔文本的编码：有BOM或样本能按UTF-8解码时用UTF-8，否则按GB18030（兼容GBK/GB2312）"""
+    if file_data.startswith(codecs.BOM_UTF16_LE) or file_data.startswith(codecs.BOM_UTF16_BE):
+        return 'utf-16'
+
+    sample = file_data[:DELIMITED_SAMPLE_BYTES]
+    try:
+        # 增量解码，样本末尾被截断的多字节字符不算错误
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8-sig'
+    except UnicodeDecodeError:
+        return 'gb18030'
+
+def read_delimited_table(file_data, filename):
+    """用pandas的C解析器读取CSV/TSV，不指定表头，与Excel的原始读取结果一致"""
+    encoding = detect_text_encoding(file_data)
+    sample_text = file_data[:DELIMITED_SAMPLE_BYTES].decode(encoding, errors='ignore')
+    sample_lines = sample_text.splitlines()[:-1] or sample_text.splitlines()
+
+    if filename.rsplit('.', 1)[1].lower() == 'tsv':
+        sep = '\t'
+    else:
+        # 部分系统导出的.csv实际是制表符分隔
+        sep = '\t' if sample_text.count('\t') > sample_text.count(',') else ','
+
+    # 标题行往往只有一个字段，按样本中最宽的行确定列数，避免C解析器按首行列数报错
+    width = max((len(row) for row in csv.reader(sample_lines, delimiter=sep)), default=1)
+    ingestion_logger.info(f"分隔文本编码: {encoding}, 分隔符: {'TAB' if sep == chr(9) else sep}, 列数: {width}")
+
+    try:
+        return pd.read_csv(io.BytesIO(file_data), header=None, names=list(range(width)), sep=sep,
+                           encoding=encoding, encoding_errors='replace', engine='c',
+                           skip_blank_lines=False, index_col=False)
+    except pd.errors.ParserError as e:
+        # 样本之后出现了更宽的行，退回到逐行解析并补齐列数
+        ingestion_logger.info(f"列数不一致，改用逐行解析: {e}")
+        text = file_data.decode(encoding, errors='replace')
+        rows = list(csv.reader(io.StringIO(text), delimiter=sep))
+        width = max((len(row) for row in rows), default=1)
+        rows = [[cell if cell != '' else None for cell in row] + [None] * (width - len(row)) for row in rows]
+        return pd.DataFrame(rows)
+
+def read_raw_table(file_data, filename):
+    """不指定表头读取上传的表格文件（Excel或CSV/TSV）"""
+    if is_delimited_file(filename):
+        return read_delimited_table(file_data, filename)
+
+    # 尝试读取为xlsx
+    try:
+        return pd.read_excel(io.BytesIO(file_data), header=None)
+    except Exception as e:
+        ingestion_logger.info(f"xlsx读取失败，尝试xls格式: {e}")
+        # 尝试读取为xls
+        return pd.read_excel(io.BytesIO(file_data), header=None, engine='xlrd')
+
+def read_table_with_header(file_data, filename, df_raw, header_row_index):
+    """以检测到的表头行读取表格
+
+    Excel按表头行重新读取；分隔文本直接从原始结果中截取，不重复解析
+    """
+    if not is_delimited_file(filename):
+        try:
+            return pd.read_excel(io.BytesIO(file_data), header=header_row_index)
+        except:
+            return pd.read_excel(io.BytesIO(file_data), header=header_row_index, engine='xlrd')
+
+    columns = []
+    seen = {}
+    header_cells = df_raw.iloc[header_row_index] if len(df_raw) > header_row_index else []
+    for i, cell in enumerate(header_cells):
+        name = f'Unnamed: {i}' if pd.isna(cell) else str(cell).strip()
+        # 与pandas读取重复列名的规则一致：第二次出现起加 .1、.2 后缀
+        if name in seen:
+            seen[name] += 1
+            name = f'{name}.{seen[name]}'
+        else:
+            seen[name] = 0
+        columns.append(name)
+
+    df = df_raw.iloc[header_row_index + 1:].reset_index(drop=True)
+    if columns:
+        df.columns = columns
+    return df
+
 def similarity(a, b):
     """计算字符串相似度"""
     return SequenceMatcher(None, a, b).ratio()
@@ -115,7 +415,7 @@ def detect_header_row(df):
         if non_empty_count >= len(row) * 0.6:  # 至少60%的单元格有内容
             score += 2
 
-        print(f"[INFO] 第{i+1}行得分: {score}, 非空单元格: {non_empty_count}, 表头样单元格: {header_like_count}")
+        ingestion_logger.debug(f"第{i+1}行得分: {score}, 非空单元格: {non_empty_count}, 表头样单元格: {header_like_count}")
 
         if score > best_score:
             best_score = score
@@ -132,7 +432,7 @@ def find_community_column(df):
         col_name_str = str(col_name).strip()
         for candidate in community_column_candidates:
             if candidate in col_name_str:
-                print(f"[INFO] 通过列名找到社区列: 第{i}列 '{col_name_str}'")
+                ingestion_logger.info(f"通过列名找到社区列: 第{i}列 '{col_name_str}'")
                 return i
 
     # 方法2: 通过内容匹配（检查每列包含社区/村的比例）
@@ -162,10 +462,10 @@ def find_community_column(df):
                 best_column = i
 
     if best_column >= 0:
-        print(f"[INFO] 通过内容匹配找到社区列: 第{best_column}列, 匹配率: {best_ratio:.2%}")
+        ingestion_logger.info(f"通过内容匹配找到社区列: 第{best_column}列, 匹配率: {best_ratio:.2%}")
         return best_column
 
-    print(f"[WARNING] 未能自动识别社区列，使用第1列作为默认")
+    ingestion_logger.warning(f"未能自动识别社区列，使用第1列作为默认")
     return 1  # 默认使用第二列
 
 def extract_community_name(text):
@@ -213,68 +513,71 @@ def smart_column_mapping(df):
 
     return column_map
 
-def extract_people_count(text):
-    """从文本中提取人数"""
-    if not text or text == 'nan' or pd.isna(text):
-        return 0
-
-    text = str(text)
-
-    # 使用正则表达式匹配"x人"模式
-    pattern = r'(\d+)人'
-    match = re.search(pattern, text)
-    if match:
-        return int(match.group(1))
-
-    return 0
-
-def process_data_value(value):
-    """处理数据值，空值默认为0"""
-    if pd.isna(value) or value == '' or str(value).strip() == '':
+def format_number(value):
+    """格式化数值合计，整数不带小数点，小数不截断有效位数也不用科学计数法"""
+    # 先舍入到10位小数，消除求和时的浮点误差（如 0.1 + 0.2）
+    value = round(float(value), 10)
+    if value.is_integer():
+        return str(int(value))
+    return f'{value:.10f}'.rstrip('0')
+
+def merge_text_values(values):
+    """合并同一社区多行中无法求和的文本，去重后用顿号连接"""
+    unique_values = []
+    for value in values:
+        if value != '0' and value not in unique_values:
+            unique_values.append(value)
+    if not unique_values:
         return '0'
-
-    return str(value).strip()
-
-def load_excel_data(file_data=None, filename=None):
-    """读取Excel文件并返回社区/村数据 - 增强版"""
-    global current_file_data, current_filename, community_data_cache
+    if len(unique_values) > MAX_MERGED_TEXT_VALUES:
+        return '、'.join(unique_values[:MAX_MERGED_TEXT_VALUES]) + f'等{len(unique_values)}项'
+    return '、'.join(unique_values)
+
+def parse_community_table(file_data=None, filename=None, progress_callback=None, record_callback=None):
+    """读取Excel文件，按社区名分组合并各行数据
+
+    返回 {'communities': 合并后的社区数据, 'header': 列名及检测结果, 'rows': 各社区的明细行,
+    'quality': 数据质量报告}，解析失败时返回None。
+    同一社区出现在多行时，人数和数值列按列求和，明细行通过 get_community_rows 查询
+    progress_callback(stage, progress) 用于报告解析进度，progress 为0到1之间的小数
+    record_callback(record_type, payload) 在检测完表头后收到 ('header', 表头信息)，之后每合并好一个社区收到 ('community', 社区数据)
+    """
+    def report_progress(stage, progress):
+        if progress_callback is not None:
+            progress_callback(stage, progress)
+
+    def emit_record(record_type, payload):
+        if record_callback is not None:
+            record_callback(record_type, payload)
 
     try:
-        # 如果没有指定文件数据，返回空字典
+        # 如果没有指定文件数据，返回None
         if file_data is None:
-            return {}
+            return None
 
-        print(f"[INFO] 开始智能解析Excel文件: {filename}")
+        ingestion_logger.info(f"开始智能解析Excel文件: {filename}")
+        report_progress('reading', 0.0)
 
-        # 从内存中的字节数据读取Excel - 支持多种格式
+        # 从内存中的字节数据读取Excel或CSV/TSV - 支持多种格式
         try:
             if isinstance(file_data, bytes):
-                # 尝试读取为xlsx
-                try:
-                    df_raw = pd.read_excel(io.BytesIO(file_data), header=None)
-                except Exception as e:
-                    print(f"[INFO] xlsx读取失败，尝试xls格式: {e}")
-                    # 尝试读取为xls
-                    df_raw = pd.read_excel(io.BytesIO(file_data), header=None, engine='xlrd')
+                df_raw = read_raw_table(file_data, filename)
             else:
-                print(f"[ERROR] 文件数据格式不正确: {type(file_data)}")
-                return {}
+                ingestion_logger.error(f"文件数据格式不正确: {type(file_data)}")
+                return None
         except Exception as e:
-            print(f"[ERROR] 文件读取失败: {e}")
-            return {}
+            ingestion_logger.error(f"文件读取失败: {e}")
+            return None
 
-        print(f"[INFO] 原始数据形状: {df_raw.shape}")
+        ingestion_logger.info(f"原始数据形状: {df_raw.shape}")
 
         # 智能检测表头行位置
+        report_progress('detecting', 0.2)
         header_row_index = detect_header_row(df_raw)
-        print(f"[INFO] 检测到表头行位置: 第{header_row_index + 1}行")
+        ingestion_logger.info(f"检测到表头行位置: 第{header_row_index + 1}行")
 
         # 使用检测到的表头行重新读取数据
-        if isinstance(file_data, bytes):
-            try:
-                df = pd.read_excel(io.BytesIO(file_data), header=header_row_index)
-            except:
-                df = pd.read_excel(io.BytesIO(file_data), header=header_row_index, engine='xlrd')
+        df = read_table_with_header(file_data, filename, df_raw, header_row_index)
 
         # 处理列名，去除空格和特殊字符，处理无意义的列名
         processed_columns = []
@@ -309,114 +612,829 @@ def load_excel_data(file_data=None, filename=None):
                     processed_columns.append(f'列{i+1}')
 
         df.columns = processed_columns
-        print(f"[INFO] 处理后数据形状: {df.shape}")
-        print(f"[INFO] 列名: {df.columns.tolist()}")
+        ingestion_logger.info(f"处理后数据形状: {df.shape}")
+        ingestion_logger.info(f"列名: {df.columns.tolist()}")
 
         # 智能寻找社区名所在的列
         community_col_index = find_community_column(df)
 
         # 智能列映射
         column_mapping = smart_column_mapping(df)
-        print(f"[INFO] 智能列映射结果: {column_mapping}")
+        ingestion_logger.info(f"智能列映射结果: {column_mapping}")
 
-        # 筛选包含社区/村的数据行
-        community_data = {}
-        processed_count = 0
-        skipped_count = 0
+        column_names = df.columns.tolist()
+        total_rows = len(df)
+        header = {
+            'columns': column_names,
+            'community_column_index': community_col_index,
+            'header_row_index': header_row_index,
+            'column_mapping': column_mapping,
+            'total_rows': total_rows
+        }
+        emit_record('header', header)
+        report_progress('rows', 0.4)
 
-        for index, row in df.iterrows():
-            # 获取社区名称
-            community_cell = row.iloc[community_col_index] if community_col_index < len(row) else None
-            community_name = extract_community_name(community_cell)
+        # 社区名只对每个不同的单元格值提取一次
+        if community_col_index < len(column_names):
+            codes, unique_cells = pd.factorize(df.iloc[:, community_col_index])
+        else:
+            codes, unique_cells = np.full(total_rows, -1), []
+        unique_names = [extract_community_name(cell) for cell in unique_cells]
+        row_names = np.array(unique_names + [None], dtype=object)[codes]  # 空单元格的编码为-1，对应末尾的None
+        community_mask = pd.notna(row_names)
+        processed_count = int(community_mask.sum())
+        skipped_count = total_rows - processed_count
+
+        # 按列位置（而不是列名，列名可能重复）计算文本、人数和数值
+        rows = df.loc[community_mask].set_axis(range(len(column_names)), axis=1)
+        keys = pd.Series(row_names[community_mask], index=rows.index)
+        texts = {}
+        counts = {}
+        numbers = {}
+        for i in range(len(column_names)):
+            text = rows[i].astype(object).where(rows[i].notna(), '').astype(str).str.strip()
+            # 含空单元格的整数列被读成浮点数，去掉多余的 ".0"
+            text = text.mask(text == '', '0').str.replace(r'^(-?\d+)\.0$', r'\1', regex=True)
+            texts[i] = text
+            counts[i] = text.str.extract(r'(\d+)人', expand=False).fillna(0).astype(int)
+            # 以0开头或超过15位的数字是编码（如身份证号），不作为数值
+            number = pd.to_numeric(text, errors='coerce')
+            numbers[i] = number.mask(text.str.match(r'^-?0\d') | (number.abs() >= 1e15))
+            report_progress('rows', 0.4 + 0.4 * (i + 1) / max(len(column_names), 1))
+
+        texts = pd.DataFrame(texts, index=rows.index)
+        counts = pd.DataFrame(counts, index=rows.index)
+        numbers = pd.DataFrame(numbers, index=rows.index)
+
+        # 社区名、身份证、电话、序号等列即使是数字也不求和
+        text_columns = {col_index for field_name, col_index in column_mapping.items()
+                        if field_name in NON_ADDITIVE_FIELDS}
+        text_columns.update(i for i, col_name in enumerate(column_names)
+                            if any(keyword in str(col_name) for keyword in NON_ADDITIVE_COLUMN_KEYWORDS))
+        text_columns.add(community_col_index)
+
+        # 一次分组得到每个社区的行数、人数合计、数值合计和是否全为数值
+        grouped_counts = counts.groupby(keys, sort=False)
+        row_counts = grouped_counts.size()
+        count_sums = grouped_counts.sum()
+        number_sums = numbers.groupby(keys, sort=False).sum()
+        all_numeric = numbers.notna().groupby(keys, sort=False).all()
+        group_positions = keys.groupby(keys, sort=False).indices
 
-            if community_name:
-                processed_count += 1
-                print(f"[INFO] 处理社区: {community_name}")
-
-                # 获取列名
-                column_names = df.columns.tolist()
-
-                # 处理各列数据
-                community_info = {
-                    'name': community_name,
-                    'columns': {},  # 存储列名和数据的映射
-                    'row_index': index,  # 记录原始行号
-                    'detected_column_index': community_col_index  # 记录检测到的社区列索引
+        community_data = {}
+        for community_name, row_count in row_counts.items():
+            positions = group_positions[community_name]
+            first_row = positions[0]
+            # 逐个社区的日志只保留前几条样本，其余在循环结束后汇总
+            if len(community_data) < ROW_LOG_SAMPLE_SIZE:
+                ingestion_logger.debug(f"处理社区: {community_name}（{row_count}行）")
+
+            if row_count == 1:
+                # 数值与多行合计使用相同的格式
+                people_counts = counts.iloc[first_row].tolist()
+                raw_values = [format_number(number) if i not in text_columns and pd.notna(number) else text
+                              for i, (text, number) in enumerate(zip(texts.iloc[first_row].tolist(),
+                                                                      numbers.iloc[first_row].tolist()))]
+            else:
+                people_counts = count_sums.loc[community_name].tolist()
+                numeric_flags = all_numeric.loc[community_name].tolist()
+                sums = number_sums.loc[community_name].tolist()
+                raw_values = []
+                for i in range(len(column_names)):
+                    if numeric_flags[i] and i not in text_columns:
+                        raw_values.append(format_number(sums[i]))
+                    elif people_counts[i] > 0:
+                        raw_values.append(f'{people_counts[i]}人')
+                    else:
+                        raw_values.append(merge_text_values(texts.iloc[positions, i].tolist()))
+
+            # 处理各列数据
+            community_info = {
+                'name': community_name,
+                'columns': {},  # 存储列名和数据的映射
+                'row_index': int(rows.index[first_row]),  # 记录第一条原始行号
+                'row_count': int(row_count),  # 该社区合并的行数
+                'detected_column_index': community_col_index  # 记录检测到的社区列索引
+            }
+
+            # 遍历所有列
+            for i, col_name in enumerate(column_names):
+                community_info['columns'][col_name] = {
+                    'raw_data': raw_values[i],
+                    'people_count': int(people_counts[i]),
+                    'column_index': i
                 }
 
-                # 遍历所有列
-                for i, col_name in enumerate(column_names):
-                    if i < len(row):
-                        col_raw = process_data_value(row.iloc[i])
-                        people_count = extract_people_count(col_raw)
-
-                        community_info['columns'][col_name] = {
-                            'raw_data': col_raw,
-                            'people_count': people_count,
-                            'column_index': i
-                        }
-
-                # 保持向后兼容性，仍然提供原来的字段
-                if len(column_names) > 1:
-                    community_info['column2'] = community_info['columns'].get(column_names[1], {}).get('raw_data', '0')
-                    community_info['people_count_col2'] = community_info['columns'].get(column_names[1], {}).get('people_count', 0)
-                if len(column_names) > 2:
-                    community_info['column3'] = community_info['columns'].get(column_names[2], {}).get('raw_data', '0')
-                    community_info['people_count_col3'] = community_info['columns'].get(column_names[2], {}).get('people_count', 0)
-                if len(column_names) > 3:
-                    community_info['column4'] = community_info['columns'].get(column_names[3], {}).get('raw_data', '0')
-                    community_info['people_count_col4'] = community_info['columns'].get(column_names[3], {}).get('people_count', 0)
-                if len(column_names) > 4:
-                    community_info['column5'] = community_info['columns'].get(column_names[4], {}).get('raw_data', '0')
-                    community_info['people_count_col5'] = community_info['columns'].get(column_names[4], {}).get('people_count', 0)
-
-                # 添加智能映射的字段
-                community_info['smart_mapping'] = {}
-                for field_name, col_index in column_mapping.items():
-                    if col_index < len(row):
-                        community_info['smart_mapping'][field_name] = {
-                            'raw_data': process_data_value(row.iloc[col_index]),
-                            'column_index': col_index,
-                            'column_name': column_names[col_index] if col_index < len(column_names) else f'Column_{col_index}'
-                        }
-
-                community_data[community_name] = community_info
-            else:
-                skipped_count += 1
+            # 保持向后兼容性，仍然提供原来的字段
+            if len(column_names) > 1:
+                community_info['column2'] = community_info['columns'].get(column_names[1], {}).get('raw_data', '0')
+                community_info['people_count_col2'] = community_info['columns'].get(column_names[1], {}).get('people_count', 0)
+            if len(column_names) > 2:
+                community_info['column3'] = community_info['columns'].get(column_names[2], {}).get('raw_data', '0')
+                community_info['people_count_col3'] = community_info['columns'].get(column_names[2], {}).get('people_count', 0)
+            if len(column_names) > 3:
+                community_info['column4'] = community_info['columns'].get(column_names[3], {}).get('raw_data', '0')
+                community_info['people_count_col4'] = community_info['columns'].get(column_names[3], {}).get('people_count', 0)
+            if len(column_names) > 4:
+                community_info['column5'] = community_info['columns'].get(column_names[4], {}).get('raw_data', '0')
+                community_info['people_count_col5'] = community_info['columns'].get(column_names[4], {}).get('people_count', 0)
+
+            # 添加智能映射的字段
+            community_info['smart_mapping'] = {}
+            for field_name, col_index in column_mapping.items():
+                if col_index < len(column_names):
+                    community_info['smart_mapping'][field_name] = {
+                        'raw_data': raw_values[col_index],
+                        'column_index': col_index,
+                        'column_name': column_names[col_index]
+                    }
+
+            community_data[community_name] = community_info
+            emit_record('community', community_info)
 
-        print(f"[INFO] 处理完成，找到 {len(community_data)} 个社区/村")
-        print(f"[INFO] 处理了 {processed_count} 行，跳过了 {skipped_count} 行")
+        report_progress('done', 1.0)
+        ingestion_logger.info(f"处理完成，找到 {len(community_data)} 个社区/村")
+        ingestion_logger.info(f"处理了 {processed_count} 行，跳过了 {skipped_count} 行")
+        multi_row_counts = row_counts[row_counts > 1]
+        if len(multi_row_counts) > 0:
+            ingestion_logger.info(f"{len(multi_row_counts)} 个社区有多行数据，已合并，"
+                                  f"最多 {int(multi_row_counts.max())} 行（{multi_row_counts.idxmax()}）")
 
         # 数据质量检测
         data_quality_report = {
-            'total_rows': len(df),
+            'total_rows': total_rows,
             'community_rows': processed_count,
             'skipped_rows': skipped_count,
-            'detection_rate': processed_count / len(df) if len(df) > 0 else 0,
+            'merged_rows': processed_count - len(community_data),
+            'detection_rate': processed_count / total_rows if total_rows > 0 else 0,
             'community_column_index': community_col_index,
             'header_row_index': header_row_index,
             'column_mapping': column_mapping
         }
 
-        print(f"[INFO] 数据质量报告: 检测率 {data_quality_report['detection_rate']:.2%}")
+        ingestion_logger.info(f"数据质量报告: 检测率 {data_quality_report['detection_rate']:.2%}")
 
         # 如果检测率过低，给出警告
         if data_quality_report['detection_rate'] < 0.3:
-            print(f"[WARNING] 社区/村检测率较低({data_quality_report['detection_rate']:.2%})，请检查文件格式")
-
-        return community_data
+            ingestion_logger.warning(f"社区/村检测率较低({data_quality_report['detection_rate']:.2%})，请检查文件格式")
+
+        return {
+            'communities': community_data,
+            'header': header,
+            'rows': {
+                'columns': column_names,
+                'texts': texts,
+                'counts': counts,
+                'positions': group_positions
+            },
+            'quality': data_quality_report
+        }
 
     except Exception as e:
-        print(f"[ERROR] 读取Excel文件出错: {e}")
-        import traceback
-        print(f"[ERROR] 错误堆栈: {traceback.format_exc()}")
-        return {}
+        ingestion_logger.exception(f"读取Excel文件出错: {e}")
+        return None
+
+def get_community_rows(rows, name, columns=None, offset=0, limit=None):
+    """从解析结果中取出某个社区合并前的明细行"""
+    if 'shared' in rows:
+        if name not in rows['shared']:
+            return None
+        records = rows['shared'][name]
+        page = records[offset:offset + limit if limit is not None else None]
+        if columns is not None:
+            page = [dict(record, columns={col_name: col_data for col_name, col_data in record['columns'].items()
+                                          if col_name in columns}) for record in page]
+        return {'name': name, 'row_count': len(records), 'offset': offset, 'rows': page}
+
+    positions = rows['positions'].get(name)
+    if positions is None:
+        return None
+
+    column_names = rows['columns']
+    selected = [i for i, col_name in enumerate(column_names) if columns is None or col_name in columns]
+    page = positions[offset:offset + limit if limit is not None else None]
+    texts = rows['texts'].iloc[page, selected]
+    counts = rows['counts'].iloc[page, selected]
+
+    records = []
+    for row_index, text_values, count_values in zip(texts.index.tolist(), texts.values.tolist(), counts.values.tolist()):
+        record = {'row_index': row_index, 'columns': {}}
+        for i, raw_data, people_count in zip(selected, text_values, count_values):
+            record['columns'][column_names[i]] = {
+                'raw_data': raw_data,
+                'people_count': int(people_count),
+                'column_index': i
+            }
+        records.append(record)
+    return {'name': name, 'row_count': len(positions), 'offset': offset, 'rows': records}
+
+def format_sse_message(event_type, data):
+    """格式化一条Server-Sent Events消息"""
+    return f"event: {event_type}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def publish_event(event_type, data):
+    """向所有SSE连接推送事件"""
+    message = format_sse_message(event_type, data)
+    with event_lock:
+        subscribers = list(event_subscribers)
+    for subscriber in subscribers:
+        try:
+            subscriber.put_nowait(message)
+        except queue.Full:
+            pass
+
+def publish_dataset(file_data, filename, digest=None):
+    """解析文件并发布为新版本的数据集
+
+    与当前数据集内容完全相同的文件不会产生新版本，直接返回当前数据集；
+    解析失败或文件中没有社区时不发布，当前数据集保持不变，返回None
+    """
+    global current_filename, current_ingestion
+
+    digest = digest or hashlib.sha1(file_data).hexdigest()
+    sync_shared_dataset()
+    with cache_lock:
+        if current_dataset is not None and current_dataset['digest'] == digest:
+            logger.info(f"文件内容未变化，沿用数据版本 {current_dataset['version']}")
+            current_filename = filename
+            current_dataset['filename'] = filename
+            return current_dataset
+
+    def on_progress(stage, progress):
+        publish_event('ingestion-progress', {
+            'filename': filename,
+            'stage': stage,
+            'progress': round(progress, 2),
+            'version': get_current_version()
+        })
+
+    # 解析过程中产生的表头和社区记录，流式接口的读者从这里按顺序读取
+    ingestion = {'filename': filename, 'records': [], 'done': False, 'condition': threading.Condition()}
+
+    def on_record(record_type, payload):
+        if record_type == 'header':
+            payload = dict(payload, filename=filename, version=None)  # 版本号在解析完成后才确定
+        with ingestion['condition']:
+            ingestion['records'].append((record_type, payload))
+            ingestion['condition'].notify_all()
+
+    # 解析放在锁外，解析期间其他请求仍可读取当前数据集
+    # 无论成功与否都要结束本次解析，否则流式接口的读者会一直等待
+    current_ingestion = ingestion
+    final_record = None
+    try:
+        parsed = parse_community_table(file_data=file_data, filename=filename,
+                                       progress_callback=on_progress, record_callback=on_record)
+        data = parsed['communities'] if parsed is not None else {}
+        if not data:
+            error = '文件解析失败' if parsed is None else '文件中没有找到有效的社区/村数据'
+            logger.warning(f"{filename}: {error}，不发布新版本")
+            final_record = ('error', {'error': error, 'version': get_current_version()})
+            return None
+
+        with shared_publish_lock():
+            # 多进程模式下其他进程可能在解析期间发布了新版本，先切换过去，保证版本号递增
+            sync_shared_dataset()
+            dataset = {
+                'version': None,
+                'digest': digest,
+                'filename': filename,
+                'communities': data,
+                'header': parsed['header'],
+                'rows': parsed['rows'],
+                'published_at': time.time()
+            }
+            evicted = install_dataset(dataset, file_data)
+            if shared_store_directory is not None:
+                write_shared_dataset(dataset, file_data)
+
+            try:
+                append_history_snapshot(dataset)
+            except Exception as e:
+                logger.error(f"写入历史记录失败: {e}")
+        final_record = ('end', {'version': dataset['version'], 'community_count': len(data)})
+    finally:
+        if final_record is None:
+            final_record = ('error', {'error': '文件处理失败', 'version': get_current_version()})
+        finish_ingestion(ingestion, final_record)
+
+    logger.info(f"发布数据版本 {dataset['version']}: {filename}，{len(data)} 个社区/村")
+    publish_event('dataset-published', {
+        'version': dataset['version'],
+        'filename': filename,
+        'community_count': len(data)
+    })
+    for evicted_version in evicted:
+        publish_event('dataset-evicted', {'version': evicted_version, 'current_version': dataset['version']})
+    return dataset
+
+def install_dataset(dataset, file_data=None):
+    """把数据集设为当前版本并清理按版本缓存的结果，未指定版本号时分配下一个，返回被淘汰的旧版本号"""
+    global current_dataset, current_file_data, current_filename, dataset_version
+
+    evicted = []
+    with cache_lock:
+        if dataset['version'] is None:
+            dataset['version'] = dataset_version + 1
+        dataset_version = dataset['version']
+        current_dataset = dataset
+        current_file_data = file_data
+        current_filename = dataset['filename']
+
+        dataset_history[dataset_version] = dataset['communities']
+        while len(dataset_history) > MAX_RETAINED_VERSIONS:
+            evicted_version, _ = dataset_history.popitem(last=False)
+            evicted.append(evicted_version)
+        dataset_changes_cache.clear()
+        query_cache.clear()
+        chart_cache.clear()
+    return evicted
+
+class SharedCommunities(Mapping):
+    """映射到共享数据文件的只读JSON对象，访问某个键时才解码对应的值"""
+
+    def __init__(self, buffer, names, offsets):
+        self.buffer = buffer
+        self.offsets = dict(zip(names, offsets))
+
+    def __getitem__(self, name):
+        return json.loads(self.raw(name))
+
+    def __contains__(self, name):
+        return name in self.offsets
+
+    def __iter__(self):
+        return iter(self.offsets)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def raw(self, name):
+        """某个键对应值的JSON字节"""
+        start, end = self.offsets[name]
+        return self.buffer[start:end]
+
+    def iter_chunks(self):
+        """分块返回整个JSON对象，不解码"""
+        for start in range(0, len(self.buffer), SHARED_RESPONSE_CHUNK_BYTES):
+            yield self.buffer[start:start + SHARED_RESPONSE_CHUNK_BYTES]
+
+@contextlib.contextmanager
+def shared_publish_lock():
+    """多进程模式下用文件锁串行化各进程的发布，单进程模式下不加锁"""
+    if shared_store_directory is None:
+        yield
+        return
+
+    import fcntl
+    with open(os.path.join(shared_store_directory, SHARED_LOCK_FILENAME), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def write_shared_blob(path, items):
+    """把 (键, 值) 依次写成一个JSON对象文件，返回每个值在文件中的 [起始, 结束) 字节偏移"""
+    offsets = []
+    position = 1
+    with open(path + '.tmp', 'wb') as f:
+        f.write(b'{')
+        for i, (key, value) in enumerate(items):
+            prefix = (b', ' if i else b'') + json.dumps(key, ensure_ascii=False).encode('utf-8') + b': '
+            body = json.dumps(value, ensure_ascii=False, default=str).encode('utf-8')
+            f.write(prefix)
+            f.write(body)
+            start = position + len(prefix)
+            offsets.append([start, start + len(body)])
+            position = start + len(body)
+        f.write(b'}')
+    os.replace(path + '.tmp', path)
+    return offsets
+
+def write_shared_dataset(dataset, file_data):
+    """把数据集写入共享目录并更新清单，其他进程据此映射同一份数据；调用方需持有发布锁"""
+    directory = shared_store_directory
+    version = dataset['version']
+    names = list(dataset['communities'].keys())
+    files = {
+        'communities': f'communities-{version}.json',
+        'page': f'page-{version}.json',
+        'rows': f'rows-{version}.json',
+        'counts': f'counts-{version}.npy',
+        'source': f'source-{version}'
+    }
+
+    offsets = write_shared_blob(os.path.join(directory, files['communities']), dataset['communities'].items())
+    page_offsets = write_shared_blob(os.path.join(directory, files['page']),
+                                     ((name, project_community_record(record, **PAGE_PROJECTION))
+                                      for name, record in dataset['communities'].items()))
+    rows = dataset.get('rows')
+    row_names = names if rows is not None else []
+    row_offsets = write_shared_blob(os.path.join(directory, files['rows']),
+                                    ((name, get_community_rows(rows, name)['rows']) for name in row_names))
+    matrix = get_count_matrix(dataset)
+    np.save(os.path.join(directory, files['counts']), matrix['counts'])
+    with open(os.path.join(directory, files['source']), 'wb') as f:
+        f.write(file_data)
+
+    manifest = {
+        'version': version,
+        'digest': dataset['digest'],
+        'filename': dataset['filename'],
+        'published_at': dataset['published_at'],
+        'header': dataset.get('header'),
+        'names': names,
+        'offsets': offsets,
+        'page_offsets': page_offsets,
+        'row_names': row_names,
+        'row_offsets': row_offsets,
+        'matrix_columns': matrix['columns'],
+        'files': files
+    }
+    manifest_path = os.path.join(directory, SHARED_MANIFEST_FILENAME)
+    with open(manifest_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(manifest_path + '.tmp', manifest_path)
+    # 本进程也直接输出共享数据中的JSON
+    dataset['projections'] = map_shared_projections(manifest)
+
+    # 已映射旧文件的进程不受删除影响
+    for old_version in range(max(1, version - MAX_RETAINED_VERSIONS - 5), version - MAX_RETAINED_VERSIONS + 1):
+        for pattern in ('communities-{}.json', 'page-{}.json', 'rows-{}.json', 'counts-{}.npy', 'source-{}'):
+            with contextlib.suppress(OSError):
+                os.remove(os.path.join(directory, pattern.format(old_version)))
+    logger.info(f"已写入共享数据版本 {version}: {len(names)} 个社区")
+
+def map_shared_file(path):
+    """以只读方式内存映射共享目录中的文件"""
+    with open(path, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def map_shared_projections(manifest):
+    """映射共享目录中的完整社区数据和页面裁剪后的社区数据，按裁剪参数索引"""
+    directory = shared_store_directory
+    files = manifest['files']
+    communities = SharedCommunities(map_shared_file(os.path.join(directory, files['communities'])),
+                                    manifest['names'], manifest['offsets'])
+    page = SharedCommunities(map_shared_file(os.path.join(directory, files['page'])),
+                             manifest['names'], manifest['page_offsets'])
+    return {
+        projection_key(None, None, None): communities,
+        projection_key(**PAGE_PROJECTION): page
+    }
+
+def attach_shared_dataset(manifest):
+    """按清单映射共享目录中的数据，不复制社区数据"""
+    directory = shared_store_directory
+    files = manifest['files']
+    counts_path = os.path.join(directory, files['counts'])
+    counts = np.load(counts_path, mmap_mode='r') if manifest['names'] else np.load(counts_path)
+    projections = map_shared_projections(manifest)
+
+    return {
+        'version': manifest['version'],
+        'digest': manifest['digest'],
+        'filename': manifest['filename'],
+        'communities': projections[projection_key(None, None, None)],
+        'projections': projections,
+        'header': manifest['header'],
+        'rows': {'shared': SharedCommunities(map_shared_file(os.path.join(directory, files['rows'])),
+                                             manifest['row_names'], manifest['row_offsets'])},
+        'count_matrix': {'names': manifest['names'], 'columns': manifest['matrix_columns'], 'counts': counts},
+        'source_path': os.path.join(directory, files['source']),
+        'published_at': manifest['published_at']
+    }
+
+def sync_shared_dataset():
+    """多进程模式下，其他进程发布了更新的版本时映射共享数据并切换为当前数据集"""
+    global shared_manifest_signature, history_index
+
+    if shared_store_directory is None:
+        return
+    manifest_path = os.path.join(shared_store_directory, SHARED_MANIFEST_FILENAME)
+    try:
+        stat = os.stat(manifest_path)
+    except FileNotFoundError:
+        return
+    signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    if signature == shared_manifest_signature:
+        return
+
+    with shared_sync_lock:
+        if signature == shared_manifest_signature:
+            return
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+        shared_manifest_signature = signature
+        if manifest['version'] <= dataset_version:
+            return
+
+        dataset = attach_shared_dataset(manifest)
+        evicted = install_dataset(dataset)
+        with history_lock:
+            history_index = None  # 历史记录由发布的进程写入，下次查询时重新加载
+
+    logger.info(f"切换到其他进程发布的数据版本 {dataset['version']}: {dataset['filename']}")
+    publish_event('dataset-published', {
+        'version': dataset['version'],
+        'filename': dataset['filename'],
+        'community_count': len(dataset['communities'])
+    })
+    for evicted_version in evicted:
+        publish_event('dataset-evicted', {'version': evicted_version, 'current_version': dataset['version']})
+
+def projection_key(columns, fields, column_fields):
+    """裁剪参数的规范形式，裁剪结果与参数顺序无关"""
+    return tuple(None if values is None else frozenset(values) for values in (columns, fields, column_fields))
+
+def get_shared_projection(dataset, columns, fields, column_fields):
+    """多进程模式下，按裁剪参数取预先写入共享目录的社区数据，没有对应的共享数据时返回None"""
+    if dataset is None or 'projections' not in dataset:
+        return None
+    return dataset['projections'].get(projection_key(columns, fields, column_fields))
+
+def poll_shared_manifest(parent_pid=None):
+    """定期检查共享清单，让只有SSE连接、没有其他请求的进程也能及时推送新版本
+
+    parent_pid 为主进程的pid，主进程意外退出后本进程删除共享目录并退出，不再占用端口
+    """
+    while True:
+        if parent_pid is not None and os.getppid() != parent_pid:
+            logger.warning(f"主进程已退出，工作进程 (pid {os.getpid()}) 随之退出")
+            # 主进程被强制结束时来不及清理，由工作进程删除共享目录（已映射的文件删除后仍可读取）
+            shutil.rmtree(shared_store_directory, ignore_errors=True)
+            os.kill(os.getpid(), signal.SIGTERM)
+            return
+        try:
+            sync_shared_dataset()
+        except Exception as e:
+            logger.error(f"同步共享数据失败: {e}")
+        time.sleep(SHARED_POLL_SECONDS)
+
+def get_current_file_data():
+    """获取当前数据集的原始文件内容，多进程模式下从共享目录读取"""
+    if current_file_data is not None:
+        return current_file_data
+    dataset = current_dataset
+    if dataset is not None and dataset.get('source_path'):
+        with open(dataset['source_path'], 'rb') as f:
+            return f.read()
+    return None
+
+def finish_ingestion(ingestion, final_record):
+    """结束一次解析，通知流式接口的读者"""
+    global current_ingestion
+    with ingestion['condition']:
+        ingestion['records'].append(final_record)
+        ingestion['done'] = True
+        ingestion['condition'].notify_all()
+    if current_ingestion is ingestion:
+        current_ingestion = None
+
+def get_current_community_data():
+    """获取当前发布的社区数据"""
+    dataset = current_dataset
+    return dataset['communities'] if dataset is not None else {}
+
+def get_current_version():
+    """获取当前数据版本号，没有数据时为0"""
+    dataset = current_dataset
+    return dataset['version'] if dataset is not None else 0
+
+def diff_community_data(old_data, new_data):
+    """比较两个版本的社区数据，返回新增、删除和单元格有变化的社区"""
+    added = {}
+    changed = {}
+    removed = [name for name in old_data if name not in new_data]
+
+    for name, record in new_data.items():
+        old_record = old_data.get(name)
+        if old_record is None:
+            added[name] = record
+            continue
+
+        old_columns = old_record.get('columns', {})
+        new_columns = record.get('columns', {})
+        cells = {}
+        for col_name in list(old_columns) + [col for col in new_columns if col not in old_columns]:
+            old_value = old_columns.get(col_name, {}).get('raw_data')
+            new_value = new_columns.get(col_name, {}).get('raw_data')
+            if old_value != new_value:
+                cells[col_name] = {'old': old_value, 'new': new_value}
+
+        if cells:
+            changed[name] = {'cells': cells, 'record': record}
+
+    return {'added': added, 'removed': removed, 'changed': changed}
+
+def get_dataset_changes(since):
+    """获取从 since 版本到当前版本的增量，since 版本已不在保留范围内时返回None"""
+    dataset = current_dataset
+    version = dataset['version'] if dataset is not None else 0
+    new_data = dataset['communities'] if dataset is not None else {}
+    key = (since, version)
+
+    with cache_lock:
+        if key in dataset_changes_cache:
+            return dataset_changes_cache[key]
+        if since == 0:
+            old_data = {}
+        elif since in dataset_history:
+            old_data = dataset_history[since]
+        else:
+            return None
+
+    changes = diff_community_data(old_data, new_data)
+    changes['version'] = version
+
+    with cache_lock:
+        dataset_changes_cache[key] = changes
+    return changes
+
+def load_map_community_names():
+    """读取SVG地图中所有社区/村区域的data-name"""
+    svg_path = os.path.join(app.static_folder, MAP_SVG_FILENAME)
+    try:
+        with open(svg_path, 'r', encoding='utf-8') as f:
+            svg_text = f.read()
+    except OSError as e:
+        logger.error(f"读取地图文件失败: {e}")
+        return []
+
+    names = []
+    for name in re.findall(r'data-name="([^"]+)"', svg_text):
+        # 与前端选择器 g[data-name*="社区"], g[data-name*="村"] 保持一致
+        if ('社区' in name or '村' in name) and name not in names:
+            names.append(name)
+    return names
+
+def normalize_community_name(name):
+    """标准化社区名称：去除空白、街道/镇前缀，统一村委会/居委会等后缀"""
+    name = re.sub(r'[\s()（）·.、]', '', str(name))
+
+    stripped = ADMIN_PREFIX_PATTERN.sub('', name, count=1)
+    if stripped != name and any(keyword in stripped for keyword in COMMUNITY_KEYWORDS):
+        name = stripped
+
+    for suffix, replacement in COMMUNITY_SUFFIX_ALIASES:
+        if name.endswith(suffix):
+            stem = name[:-len(suffix)]
+            # "海达社区居委会"、"石塘村村民委员会"已带社区/村后缀，只去掉委员会部分
+            name = stem if stem.endswith(('社区', '村')) else stem + replacement
+            break
+
+    return name
+
+def community_core_name(name):
+    """去掉社区/村后缀的名称主体，用于"海达社区"与"海达村"之类的匹配"""
+    normalized = normalize_community_name(name)
+    for suffix in ('社区', '村'):
+        if normalized.endswith(suffix) and len(normalized) > len(suffix):
+            return normalized[:-len(suffix)]
+    return normalized
+
+def name_bigrams(name):
+    """名称的字符二元组集合，单字名称返回其本身"""
+    if len(name) < 2:
+        return {name}
+    return {name[i:i + 2] for i in range(len(name) - 1)}
+
+def build_reconciliation_index(map_names, data_names):
+    """为每个地图社区找到最匹配的Excel社区
+
+    依次使用精确匹配、标准化后缀匹配和n-gram相似度匹配，每个Excel社区最多对应一个地图社区
+    """
+    matches = {}
+    claimed = set()
+    data_names = list(data_names)
+    data_name_set = set(data_names)
+
+    def claim(map_name, data_name, method, score):
+        matches[map_name] = {'data_name': data_name, 'method': method, 'score': round(score, 3)}
+        claimed.add(data_name)
+
+    # 1. 精确匹配
+    for map_name in map_names:
+        if map_name in data_name_set:
+            claim(map_name, map_name, 'exact', 1.0)
+
+    # 2. 标准化匹配：先比较完整的标准化名称，再比较去掉社区/村后缀的主体
+    for key_func, score in ((normalize_community_name, 0.95), (community_core_name, 0.9)):
+        data_by_key = {}
+        for data_name in data_names:
+            if data_name not in claimed:
+                data_by_key.setdefault(key_func(data_name), []).append(data_name)
+
+        for map_name in map_names:
+            if map_name in matches:
+                continue
+            candidates = [name for name in data_by_key.get(key_func(map_name), []) if name not in claimed]
+            # 只接受唯一的候选，避免歧义匹配
+            if len(candidates) == 1:
+                claim(map_name, candidates[0], 'normalized', score)
+
+    # 3. n-gram相似度匹配：用倒排索引只比较共享二元组的候选，按得分从高到低贪心分配
+    bigram_index = {}
+    data_bigrams = {}
+    for data_name in data_names:
+        if data_name in claimed:
+            continue
+        grams = name_bigrams(community_core_name(data_name))
+        data_bigrams[data_name] = grams
+        for gram in grams:
+            bigram_index.setdefault(gram, set()).add(data_name)
+
+    scored_pairs = []
+    for map_name in map_names:
+        if map_name in matches:
+            continue
+        map_grams = name_bigrams(community_core_name(map_name))
+        candidates = set()
+        for gram in map_grams:
+            candidates |= bigram_index.get(gram, set())
+        for data_name in candidates:
+            grams = data_bigrams[data_name]
+            score = 2 * len(map_grams & grams) / (len(map_grams) + len(grams))
+            if score >= NGRAM_MATCH_THRESHOLD:
+                scored_pairs.append((score, map_name, data_name))
+
+    for score, map_name, data_name in sorted(scored_pairs, key=lambda pair: -pair[0]):
+        if map_name not in matches and data_name not in claimed:
+            claim(map_name, data_name, 'ngram', score)
+
+    return {
+        'matches': matches,
+        'data_to_map': {match['data_name']: map_name for map_name, match in matches.items()},
+        'unmatched_map': [name for name in map_names if name not in matches],
+        'unmatched_data': [name for name in data_names if name not in claimed]
+    }
+
+def get_reconciliation_index():
+    """获取当前地图与当前数据的对照索引，每个(地图, 数据)版本只计算一次"""
+    global reconciliation_cache
+
+    data = get_current_community_data()
+    svg_path = os.path.join(app.static_folder, MAP_SVG_FILENAME)
+    try:
+        map_version = os.path.getmtime(svg_path)
+    except OSError:
+        map_version = None
+
+    with cache_lock:
+        if (reconciliation_cache.get('map_version') == map_version and
+                reconciliation_cache.get('data') is data):
+            return reconciliation_cache['index']
+
+    index = build_reconciliation_index(load_map_community_names(), data.keys())
+    logger.info(f"社区对照索引: 匹配 {len(index['matches'])} 个, "
+          f"地图未匹配 {len(index['unmatched_map'])} 个, 数据未匹配 {len(index['unmatched_data'])} 个")
+
+    with cache_lock:
+        reconciliation_cache = {'map_version': map_version, 'data': data, 'index': index}
+    return index
+
+def resolve_community_name(name, data):
+    """把地图上的社区名解析为数据中的社区名"""
+    if name in data:
+        return name
+    match = get_reconciliation_index()['matches'].get(name)
+    return match['data_name'] if match else None
+
+def parse_list_arg(name):
+    """读取逗号分隔或重复出现的查询参数，未提供时返回None"""
+    values = request.args.getlist(name)
+    if not values:
+        return None
+    return [item.strip() for value in values for item in value.split(',') if item.strip()]
+
+def project_community_record(record, columns=None, fields=None, column_fields=None):
+    """按需裁剪社区数据
+
+    columns: 只保留这些数据列；fields: 只保留这些顶层字段；column_fields: 每列只保留这些子字段
+    """
+    projected = {}
+    for key, value in record.items():
+        if fields is not None and key not in fields:
+            continue
+        if key == 'columns':
+            value = {
+                col_name: (col_data if column_fields is None
+                           else {k: v for k, v in col_data.items() if k in column_fields})
+                for col_name, col_data in value.items()
+                if columns is None or col_name in columns
+            }
+        projected[key] = value
+    return projected
+
+@app.before_request
+def sync_before_request():
+    """多进程模式下，处理请求前先切换到其他进程发布的最新数据"""
+    sync_shared_dataset()
 
 @app.route('/api/upload', methods=['POST'])
 def upload_file():
     """处理Excel文件上传 - 使用内存模式"""
-    global current_file_data, current_filename
-
     try:
         if 'file' not in request.files:
             return jsonify({'error': '没有文件被上传'}), 400
@@ -437,50 +1455,45 @@ def upload_file():
         if file and allowed_file(file.filename):
             # 获取原始文件名
             original_filename = file.filename
-            print(f"[INFO] 开始处理文件：{original_filename}")
+            logger.info(f"开始处理文件：{original_filename}")
         else:
-            return jsonify({'error': '只支持 .xlsx 和 .xls 文件'}), 400
+            return jsonify({'error': '只支持 .xlsx、.xls、.csv 和 .tsv 文件'}), 400
 
         try:
             # 直接读取文件内容到内存
             file_data = file.read()
-            print(f"[INFO] 文件读取成功，大小：{len(file_data)} 字节")
-
-            # 存储文件数据和文件名到全局变量
-            current_file_data = file_data
-            current_filename = original_filename
+            logger.info(f"文件读取成功，大小：{len(file_data)} 字节")
 
-            # 直接从内存数据加载并分析文件
-            data = load_excel_data(file_data=file_data, filename=original_filename)
-            community_count = len(data)
+            # 直接从内存数据加载并分析文件，发布为新版本
+            dataset = publish_dataset(file_data, original_filename)
 
-            if community_count > 0:
-                print(f"[INFO] 文件处理成功：{original_filename}，找到 {community_count} 个社区/村")
+            if dataset is not None:
+                community_count = len(dataset['communities'])
+                logger.info(f"文件处理成功：{original_filename}，找到 {community_count} 个社区/村")
                 response_data = {
                     'success': True,
                     'message': f'文件上传成功！找到 {community_count} 个社区/村数据',
                     'filename': original_filename,
-                    'community_count': community_count
+                    'community_count': community_count,
+                    'version': dataset['version']
                 }
                 return jsonify(response_data)
             else:
                 return jsonify({'error': '文件中没有找到有效的社区/村数据'}), 400
 
         except Exception as e:
-            print(f"[ERROR] 处理文件时出错：{str(e)}")
+            logger.error(f"处理文件时出错：{str(e)}")
             return jsonify({'error': f'文件格式错误：{str(e)}'}), 400
 
     except Exception as e:
-        print(f"[ERROR] 上传过程出错：{str(e)}")
+        logger.error(f"上传过程出错：{str(e)}")
         return jsonify({'error': f'上传失败：{str(e)}'}), 500
 
 @app.route('/api/current-file')
 def get_current_file():
     """获取当前使用的Excel文件信息"""
-    global current_file_data, current_filename
-
     try:
-        if current_file_data is None or current_filename is None:
+        if current_dataset is None or current_filename is None:
             response_data = {
                 'filename': '请选择文件',
                 'community_count': 0,
@@ -489,19 +1502,20 @@ def get_current_file():
             }
             return jsonify(response_data)
 
-        # 从内存数据获取信息
-        data = load_excel_data(file_data=current_file_data, filename=current_filename)
+        # 直接使用已发布的数据集，不重新解析
+        data = get_current_community_data()
         community_count = len(data)
 
         response_data = {
             'filename': current_filename,
             'community_count': community_count,
-            'file_exists': True
+            'file_exists': True,
+            'version': get_current_version()
         }
         return jsonify(response_data)
 
     except Exception as e:
-        print(f"[ERROR] 获取文件信息失败: {str(e)}")
+        logger.error(f"获取文件信息失败: {str(e)}")
         error_response = {
             'filename': current_filename or '未知文件',
             'community_count': 0,
@@ -514,26 +1528,20 @@ def get_current_file():
 def get_data_quality():
     """获取数据质量报告"""
     try:
-        if current_file_data is None:
+        file_data = get_current_file_data()
+        if file_data is None:
             return jsonify({'error': '没有上传文件'}), 400
 
         # 重新分析文件以获取详细的质量报告
-        file_data = current_file_data
         filename = current_filename
 
         # 读取原始数据
-        try:
-            df_raw = pd.read_excel(io.BytesIO(file_data), header=None)
-        except:
-            df_raw = pd.read_excel(io.BytesIO(file_data), header=None, engine='xlrd')
+        df_raw = read_raw_table(file_data, filename)
 
         # 智能检测
         header_row_index = detect_header_row(df_raw)
 
-        try:
-            df = pd.read_excel(io.BytesIO(file_data), header=header_row_index)
-        except:
-            df = pd.read_excel(io.BytesIO(file_data), header=header_row_index, engine='xlrd')
+        df = read_table_with_header(file_data, filename, df_raw, header_row_index)
 
         df.columns = [str(col).strip() for col in df.columns]
         community_col_index = find_community_column(df)
@@ -576,7 +1584,7 @@ def get_data_quality():
         return jsonify(quality_report)
 
     except Exception as e:
-        print(f"[ERROR] 获取数据质量报告失败: {str(e)}")
+        logger.error(f"获取数据质量报告失败: {str(e)}")
         return jsonify({'error': f'获取数据质量报告失败：{str(e)}'}), 500
 
 @app.route('/test')
@@ -657,47 +1665,1151 @@ def index():
 def get_community_data(community_name):
     """获取指定社区的数据"""
     try:
-        data = load_excel_data(file_data=current_file_data, filename=current_filename)
-
-        if community_name in data:
-            community_data = data[community_name]
+        dataset = current_dataset
+        data = get_current_community_data()
+        data_name = resolve_community_name(community_name, data)
+        columns = parse_list_arg('columns')
+        fields = parse_list_arg('fields')
+        column_fields = parse_list_arg('column_fields')
+
+        shared = get_shared_projection(dataset, columns, fields, column_fields)
+        if data_name is not None and shared is not None:
+            # 多进程模式下直接返回共享数据中的JSON，不解码
+            return Response(shared.raw(data_name), mimetype='application/json')
+        if data_name is not None:
+            community_data = project_community_record(data[data_name], columns, fields, column_fields)
             return jsonify(community_data)
         else:
             return jsonify({'error': '未找到该社区数据'}), 404
     except Exception as e:
-        print(f"[ERROR] 获取社区数据失败: {str(e)}")
+        logger.error(f"获取社区数据失败: {str(e)}")
         return jsonify({'error': f'获取社区数据失败：{str(e)}'}), 500
 
+@app.route('/api/community/<community_name>/rows')
+def get_community_detail_rows(community_name):
+    """获取指定社区合并前的明细行，支持 columns 参数及 offset / limit 分页"""
+    try:
+        dataset = current_dataset
+        if dataset is None or dataset.get('rows') is None:
+            return jsonify({'error': '未找到该社区数据'}), 404
+
+        data_name = resolve_community_name(community_name, dataset['communities'])
+        if data_name is None:
+            return jsonify({'error': '未找到该社区数据'}), 404
+
+        offset = max(0, request.args.get('offset', 0, type=int))
+        limit = request.args.get('limit', type=int)
+        if limit is not None:
+            limit = max(0, limit)
+        result = get_community_rows(dataset['rows'], data_name, parse_list_arg('columns'), offset, limit)
+        if result is None:
+            return jsonify({'error': '未找到该社区数据'}), 404
+
+        result['version'] = dataset['version']
+        return jsonify(result)
+    except Exception as e:
+        logger.error(f"获取社区明细行失败: {str(e)}")
+        return jsonify({'error': f'获取社区明细行失败：{str(e)}'}), 500
+
+@app.route('/api/reconciliation')
+def get_reconciliation():
+    """获取地图社区与Excel社区的对照关系及未匹配列表"""
+    try:
+        return jsonify(get_reconciliation_index())
+    except Exception as e:
+        logger.error(f"获取社区对照索引失败: {str(e)}")
+        return jsonify({'error': f'获取社区对照索引失败：{str(e)}'}), 500
+
 @app.route('/api/communities')
 def get_all_communities():
-    """获取所有社区数据"""
+    """获取所有社区数据，支持 columns / fields / column_fields 参数裁剪返回字段"""
     try:
-        data = load_excel_data(file_data=current_file_data, filename=current_filename)
-        return jsonify(data)
+        dataset = current_dataset
+        columns = parse_list_arg('columns')
+        fields = parse_list_arg('fields')
+        column_fields = parse_list_arg('column_fields')
+
+        shared = get_shared_projection(dataset, columns, fields, column_fields)
+        if shared is not None:
+            # 多进程模式下直接分块输出共享数据中的JSON，不解码
+            response = Response(shared.iter_chunks(), mimetype='application/json')
+        else:
+            data = dataset['communities'] if dataset is not None else {}
+            if columns is not None or fields is not None or column_fields is not None:
+                data = {
+                    name: project_community_record(record, columns, fields, column_fields)
+                    for name, record in data.items()
+                }
+            response = jsonify(data)
+        response.headers['X-Dataset-Version'] = str(dataset['version'] if dataset is not None else 0)
+        return response
     except Exception as e:
-        print(f"[ERROR] 获取社区数据失败: {str(e)}")
+        logger.error(f"获取社区数据失败: {str(e)}")
         return jsonify({})
 
+def format_stream_record(record_type, payload, columns=None, fields=None, column_fields=None):
+    """把一条流式记录格式化为一行NDJSON，社区记录按参数裁剪字段"""
+    if record_type == 'community':
+        payload = {'name': payload['name'],
+                   'record': project_community_record(payload, columns, fields, column_fields)}
+    return json.dumps(dict(payload, type=record_type), ensure_ascii=False, default=str) + '\n'
+
+def iter_ingestion_records(ingestion):
+    """随解析进度依次返回记录，每次返回当前已产生的全部新记录，解析结束后停止"""
+    position = 0
+    while True:
+        with ingestion['condition']:
+            while position >= len(ingestion['records']) and not ingestion['done']:
+                ingestion['condition'].wait(SSE_HEARTBEAT_SECONDS)
+            records = ingestion['records'][position:]
+            done = ingestion['done']
+        position += len(records)
+        yield records
+        if done and position >= len(ingestion['records']):
+            return
+
+def iter_shared_stream(dataset, shared):
+    """多进程模式下按流式记录的格式分块输出已发布的数据集，社区记录直接拼接共享数据中的JSON，不解码"""
+    header = dict(dataset.get('header') or {}, version=dataset['version'], filename=dataset['filename'])
+    chunk = [format_stream_record('header', header).encode('utf-8')]
+    for name in shared:
+        chunk.append(b'{"name": ' + json.dumps(name, ensure_ascii=False).encode('utf-8') + b', "record": ' +
+                     shared.raw(name) + b', "type": "community"}\n')
+        if len(chunk) >= EXPORT_CHUNK_ROWS:
+            yield b''.join(chunk)
+            chunk = []
+    chunk.append(format_stream_record('end', {'version': dataset['version'],
+                                              'community_count': len(shared)}).encode('utf-8'))
+    yield b''.join(chunk)
+
+def iter_dataset_records(dataset):
+    """按流式记录的格式分块返回已发布的数据集"""
+    if dataset is None:
+        yield [('end', {'version': 0, 'community_count': 0})]
+        return
+
+    header = dict(dataset.get('header') or {}, version=dataset['version'], filename=dataset['filename'])
+    records = [('header', header)]
+    for record in dataset['communities'].values():
+        records.append(('community', record))
+        if len(records) >= EXPORT_CHUNK_ROWS:
+            yield records
+            records = []
+    records.append(('end', {'version': dataset['version'], 'community_count': len(dataset['communities'])}))
+    yield records
+
+@app.route('/api/communities/stream')
+def stream_communities():
+    """以NDJSON逐行返回社区数据：先是表头记录（列名及检测结果），然后每个社区一行，最后是结束记录
+
+    有文件正在解析时随解析进度输出，否则输出当前数据集；支持 columns / fields / column_fields 参数
+    """
+    columns = parse_list_arg('columns')
+    fields = parse_list_arg('fields')
+    column_fields = parse_list_arg('column_fields')
+    ingestion = current_ingestion
+    dataset = current_dataset
+    shared = get_shared_projection(dataset, columns, fields, column_fields) if ingestion is None else None
+
+    def generate():
+        if shared is not None:
+            yield from iter_shared_stream(dataset, shared)
+            return
+        chunks = iter_ingestion_records(ingestion) if ingestion is not None else iter_dataset_records(dataset)
+        for records in chunks:
+            if records:
+                yield ''.join(format_stream_record(record_type, payload, columns, fields, column_fields)
+                              for record_type, payload in records)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/communities/changes')
+def get_communities_changes():
+    """获取自 since 版本以来的社区数据增量
+
+    返回新增、删除和有变化的社区；since 版本过旧时返回 full_reload，客户端需重新获取全部数据
+    """
+    try:
+        since = request.args.get('since', type=int)
+        if since is None or since < 0:
+            return jsonify({'error': '请提供有效的 since 版本号'}), 400
+
+        version = get_current_version()
+        if since > version:
+            return jsonify({'version': version, 'since': since, 'full_reload': True})
+
+        changes = get_dataset_changes(since)
+        if changes is None:
+            return jsonify({'version': version, 'since': since, 'full_reload': True})
+        version = changes['version']
+
+        columns = parse_list_arg('columns')
+        fields = parse_list_arg('fields')
+        column_fields = parse_list_arg('column_fields')
+
+        return jsonify({
+            'version': version,
+            'since': since,
+            'full_reload': False,
+            'added': {
+                name: project_community_record(record, columns, fields, column_fields)
+                for name, record in changes['added'].items()
+            },
+            'removed': changes['removed'],
+            'changed': {
+                name: {
+                    'cells': change['cells'],
+                    'record': project_community_record(change['record'], columns, fields, column_fields)
+                }
+                for name, change in changes['changed'].items()
+            }
+        })
+    except Exception as e:
+        logger.error(f"获取数据增量失败: {str(e)}")
+        return jsonify({'error': f'获取数据增量失败：{str(e)}'}), 500
+
+@app.route('/api/events')
+def stream_events():
+    """以Server-Sent Events推送数据发布、解析进度和版本淘汰事件"""
+    subscriber = queue.Queue(maxsize=SSE_QUEUE_SIZE)
+    with event_lock:
+        event_subscribers.append(subscriber)
+
+    def generate():
+        try:
+            # 连接建立时先告知当前版本，客户端据此判断是否需要更新
+            dataset = current_dataset
+            yield 'retry: 3000\n\n'
+            if dataset is not None:
+                yield format_sse_message('dataset-published', {
+                    'version': dataset['version'],
+                    'filename': dataset['filename'],
+                    'community_count': len(dataset['communities'])
+                })
+            while True:
+                try:
+                    yield subscriber.get(timeout=SSE_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ': heartbeat\n\n'
+        finally:
+            with event_lock:
+                event_subscribers.remove(subscriber)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def get_request_list(name):
+    """从JSON请求体、表单或查询参数中读取列表参数，未提供时返回None"""
+    payload = request.get_json(silent=True)
+    if isinstance(payload, dict) and payload.get(name) is not None:
+        value = payload[name]
+        return value if isinstance(value, list) else [value]
+    if request.form.getlist(name):
+        return request.form.getlist(name)
+    return parse_list_arg(name)
+
+def get_request_value(name, default=None):
+    """从JSON请求体、表单或查询参数中读取单个参数"""
+    payload = request.get_json(silent=True)
+    if isinstance(payload, dict) and payload.get(name) is not None:
+        return payload[name]
+    return request.form.get(name) or request.args.get(name) or default
+
+def get_data_columns(data):
+    """获取全部数据列名，社区名所在的列除外"""
+    columns = []
+    for record in data.values():
+        for col_name, col_data in record.get('columns', {}).items():
+            if col_data.get('column_index') == record.get('detected_column_index'):
+                continue
+            if col_name not in columns:
+                columns.append(col_name)
+    return columns
+
+def get_count_matrix(dataset):
+    """获取数据集的 (社区 × 数据列) 人数矩阵，每个版本只构建一次"""
+    matrix = dataset.get('count_matrix')
+    if matrix is None:
+        data = dataset['communities']
+        names = list(data.keys())
+        columns = get_data_columns(data)
+        counts = np.array(
+            [[record['columns'].get(col, {}).get('people_count', 0) for col in columns] for record in data.values()],
+            dtype=np.int64
+        ).reshape(len(names), len(columns))
+        matrix = {'names': names, 'columns': columns, 'counts': counts}
+        dataset['count_matrix'] = matrix
+    return matrix
+
+def parse_query_filters(filters):
+    """解析过滤条件，返回 [(列名, 运算符, 人数)]，格式不正确时抛出ValueError"""
+    parsed = []
+    for text in filters or []:
+        if not isinstance(text, str):
+            raise ValueError(f'过滤条件必须是字符串: {json.dumps(text, ensure_ascii=False)}')
+        match = QUERY_FILTER_PATTERN.match(text.strip())
+        if not match:
+            raise ValueError(f'无法识别的过滤条件: {text}')
+        parsed.append((match.group(1).strip(), match.group(2), int(match.group(3))))
+    return parsed
+
+def run_community_query(dataset, filters, columns=None, sort=None, order='desc', limit=None):
+    """在人数矩阵上过滤、排序并取前 limit 个社区
+
+    columns 为参与合计和返回的数据列（默认全部），sort 为排序列名（默认按合计人数）。
+    取前k个时用 np.partition 部分选择，只对选出的k个社区排序
+    """
+    matrix = get_count_matrix(dataset)
+    positions = {col: j for j, col in enumerate(matrix['columns'])}
+    counts = matrix['counts']
+
+    columns = columns or matrix['columns']
+    for col in columns:
+        if col not in positions:
+            raise ValueError(f'数据列不存在: {col}')
+    selected = counts[:, [positions[col] for col in columns]]
+    totals = selected.sum(axis=1)
+
+    def column_values(col):
+        if col == TOTAL_COLUMN_NAME:
+            return totals
+        if col not in positions:
+            raise ValueError(f'数据列不存在: {col}')
+        return counts[:, positions[col]]
+
+    mask = np.ones(len(matrix['names']), dtype=bool)
+    for col, op, value in filters:
+        mask &= QUERY_OPERATORS[op](column_values(col), value)
+
+    candidates = np.flatnonzero(mask)
+    keys = column_values(sort or TOTAL_COLUMN_NAME)[candidates]
+    if order == 'desc':
+        keys = -keys
+    if limit is not None and limit < len(candidates):
+        if limit > 0:
+            # 部分选择出第k小的键；与它并列的社区按原始顺序取，argpartition 在并列时的选择是任意的
+            kth = np.partition(keys, limit - 1)[limit - 1]
+            better = np.flatnonzero(keys < kth)
+            top = np.concatenate((better, np.flatnonzero(keys == kth)[:limit - len(better)]))
+        else:
+            top = np.array([], dtype=np.int64)
+    else:
+        top = np.arange(len(candidates))
+    # 人数相同时保持数据中的原始顺序
+    ranked = candidates[top[np.lexsort((candidates[top], keys[top]))]]
+
+    data_to_map = get_reconciliation_index()['data_to_map']
+    results = []
+    for rank, i in enumerate(ranked.tolist(), start=1):
+        name = matrix['names'][i]
+        results.append({
+            'rank': rank,
+            'name': name,
+            'map_name': data_to_map.get(name, name),
+            'counts': dict(zip(columns, selected[i].tolist())),
+            'total': int(totals[i])
+        })
+
+    return {
+        'version': dataset['version'],
+        'matched': len(candidates),
+        'columns': columns,
+        'sort': sort or TOTAL_COLUMN_NAME,
+        'order': order,
+        'limit': limit,
+        'communities': results,
+        'names': [result['name'] for result in results],
+        'map_names': [result['map_name'] for result in results]
+    }
+
+def get_history_directory():
+    """历史快照所在目录，未启用历史记录时返回None"""
+    directory = app.config.get('HISTORY_DIRECTORY')
+    if not directory:
+        return None
+    return os.path.join(get_app_directory(), directory)
+
+def index_history_snapshot(position, snapshot):
+    """把快照中的社区加入按标准化社区名的索引"""
+    for row, name in enumerate(snapshot['names']):
+        history_name_index.setdefault(normalize_community_name(name), []).append((position, row))
+
+def load_history_index():
+    """加载历史快照索引，调用方需持有 history_lock"""
+    global history_index
+    if history_index is not None:
+        return history_index
+
+    directory = get_history_directory()
+    history_index = {'templates': {}, 'snapshots': []}
+    try:
+        if directory is not None:
+            with open(os.path.join(directory, HISTORY_INDEX_FILENAME), encoding='utf-8') as f:
+                history_index = json.load(f)
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as e:
+        logger.warning(f"历史索引读取失败，将重新开始记录: {e}")
+
+    history_name_index.clear()
+    for position, snapshot in enumerate(history_index['snapshots']):
+        index_history_snapshot(position, snapshot)
+    logger.info(f"已加载 {len(history_index['snapshots'])} 个历史快照")
+    return history_index
+
+def append_history_snapshot(dataset):
+    """把数据集的人数矩阵追加到磁盘历史记录，按上传时间和模板（数据列组合）命名，连续重复上传同一内容只记录一次"""
+    directory = get_history_directory()
+    if directory is None:
+        return None
+
+    matrix = get_count_matrix(dataset)
+    columns = matrix['columns']
+    template = hashlib.sha1('\u0000'.join(columns).encode('utf-8')).hexdigest()[:12]
+    snapshot_id = f"{int(dataset['published_at'] * 1000)}_{template}"
+
+    with history_lock:
+        index = load_history_index()
+        # 只跳过与上一次相同的内容；与更早某次相同的数据（如某月与前几个月一样）仍是时间序列上的一个点
+        if index['snapshots'] and index['snapshots'][-1]['digest'] == dataset['digest']:
+            return None
+
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, f'{snapshot_id}.npy'), matrix['counts'])
+        snapshot = {
+            'id': snapshot_id,
+            'uploaded_at': dataset['published_at'],
+            'filename': dataset['filename'],
+            'digest': dataset['digest'],
+            'template': template,
+            'names': matrix['names']
+        }
+        index['templates'][template] = columns
+        index['snapshots'].append(snapshot)
+        index_history_snapshot(len(index['snapshots']) - 1, snapshot)
+
+        # 先写临时文件再替换，避免中途退出留下损坏的索引
+        index_path = os.path.join(directory, HISTORY_INDEX_FILENAME)
+        with open(index_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False)
+        os.replace(index_path + '.tmp', index_path)
+
+    logger.info(f"已记录历史快照 {snapshot_id}: {len(matrix['names'])} 个社区, {len(columns)} 列")
+    return snapshot
+
+def load_history_array(snapshot_id):
+    """以内存映射方式读取快照的人数矩阵，调用方需持有 history_lock"""
+    array = history_arrays.get(snapshot_id)
+    if array is None:
+        array = np.load(os.path.join(get_history_directory(), f'{snapshot_id}.npy'), mmap_mode='r')
+        history_arrays[snapshot_id] = array
+    return array
+
+def get_community_history(name, columns=None):
+    """获取社区各数据列在历次上传中的人数，社区从未出现过时返回None"""
+    with history_lock:
+        index = load_history_index()
+        entries = history_name_index.get(normalize_community_name(name))
+        if not entries:
+            return None
+
+        templates = index['templates']
+        if columns is None:
+            columns = []
+            for position, _ in entries:
+                for col in templates[index['snapshots'][position]['template']]:
+                    if col not in columns:
+                        columns.append(col)
+
+        result = {
+            'name': name,
+            'columns': columns,
+            'uploaded_at': [],
+            'filenames': [],
+            'templates': [],
+            'series': {col: [] for col in columns}
+        }
+        seen_positions = set()
+        for position, row in entries:
+            # 同一次上传中有多个社区标准化后同名时只取第一个
+            if position in seen_positions:
+                continue
+            seen_positions.add(position)
+            snapshot = index['snapshots'][position]
+            positions = {col: j for j, col in enumerate(templates[snapshot['template']])}
+            counts = load_history_array(snapshot['id'])[row]
+            result['uploaded_at'].append(snapshot['uploaded_at'])
+            result['filenames'].append(snapshot['filename'])
+            result['templates'].append(snapshot['template'])
+            for col in columns:
+                # 该次上传的模板中没有这一列时为null
+                result['series'][col].append(int(counts[positions[col]]) if col in positions else None)
+    return result
+
+def short_community_name(name):
+    """图表上显示的社区简称"""
+    return name.replace('社区', '').replace('村', '')
+
+def svg_text(x, y, text, font_size, fill, font_weight='bold', baseline=None):
+    """生成SVG文字元素"""
+    baseline_attr = f' dominant-baseline="{baseline}"' if baseline else ''
+    return (f'<text x="{x:.2f}" y="{y:.2f}" text-anchor="middle"{baseline_attr} font-size="{font_size}" '
+            f'font-family="Microsoft YaHei" fill="{fill}" font-weight="{font_weight}">{html.escape(str(text))}</text>')
+
+def render_pie_chart_svg(name, values):
+    """绘制环形饼图，圆心位于片段中心"""
+    radius = PIE_CHART_RADIUS
+    inner_radius = radius * 0.3
+    half = PIE_CHART_SIZE / 2
+    total = sum(value for value, _ in values)
+
+    parts = []
+    current_angle = -90.0  # 从顶部开始
+    for value, color in values:
+        if value <= 0:
+            continue
+        percentage = value / total
+        angle = min(percentage * 360, 359.99)  # 整圆时起点和终点重合，圆弧会消失
+        if angle < 1:  # 忽略太小的扇形
+            continue
+
+        start = math.radians(current_angle)
+        end = math.radians(current_angle + angle)
+        large_arc = 1 if angle > 180 else 0
+        x1, y1 = inner_radius * math.cos(start), inner_radius * math.sin(start)
+        x2, y2 = radius * math.cos(start), radius * math.sin(start)
+        x3, y3 = radius * math.cos(end), radius * math.sin(end)
+        x4, y4 = inner_radius * math.cos(end), inner_radius * math.sin(end)
+        parts.append(
+            f'<path d="M {x1:.2f} {y1:.2f} L {x2:.2f} {y2:.2f} '
+            f'A {radius} {radius} 0 {large_arc} 1 {x3:.2f} {y3:.2f} L {x4:.2f} {y4:.2f} '
+            f'A {inner_radius:.2f} {inner_radius:.2f} 0 {large_arc} 0 {x1:.2f} {y1:.2f} Z" '
+            f'fill="{color["main"]}" stroke="white" stroke-width="2" opacity="0.8"/>'
+        )
+
+        # 只为大于5%的扇形添加数值标签
+        if percentage > 0.05:
+            label_angle = math.radians(current_angle + angle / 2)
+            label_radius = (radius + inner_radius) / 2
+            parts.append(svg_text(label_radius * math.cos(label_angle), label_radius * math.sin(label_angle),
+                                  value, 8, 'white', baseline='central'))
+        current_angle += angle
+
+    if parts:
+        parts.append(svg_text(0, 0, short_community_name(name), 10, '#333', baseline='central'))
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{PIE_CHART_SIZE}" height="{PIE_CHART_SIZE}" '
+            f'viewBox="{-half} {-half} {PIE_CHART_SIZE} {PIE_CHART_SIZE}">{"".join(parts)}</svg>')
+
+def bar_chart_width(column_count):
+    """柱状图片段的宽度"""
+    bars_width = column_count * BAR_CHART_BAR_WIDTH + max(column_count - 1, 0) * BAR_CHART_BAR_SPACING
+    return max(BAR_CHART_MIN_WIDTH, bars_width + 8)
+
+def render_bar_chart_svg(name, values, max_value):
+    """绘制多列柱状图，基线中点位于片段的 (0, 0)，max_value 为所有选中社区的最大值"""
+    width = bar_chart_width(len(values))
+    height = BAR_CHART_TOP + BAR_CHART_BOTTOM
+    bars_width = len(values) * BAR_CHART_BAR_WIDTH + max(len(values) - 1, 0) * BAR_CHART_BAR_SPACING
+    start_x = -bars_width / 2
+
+    parts = []
+    if max_value > 0:
+        for index, (value, color) in enumerate(values):
+            bar_height = max(value / max_value * BAR_CHART_MAX_HEIGHT, BAR_CHART_MIN_HEIGHT)
+            bar_x = start_x + index * (BAR_CHART_BAR_WIDTH + BAR_CHART_BAR_SPACING)
+            if value > 0:
+                parts.append(svg_text(bar_x + BAR_CHART_BAR_WIDTH / 2, -bar_height - 3, value, 8, color['dark']))
+            parts.append(f'<rect x="{bar_x:.2f}" y="{-bar_height:.2f}" width="{BAR_CHART_BAR_WIDTH}" '
+                         f'height="{bar_height:.2f}" fill="{color["main"]}" stroke="{color["dark"]}" '
+                         f'stroke-width="1" rx="2"/>')
+        parts.append(svg_text(0, 15, short_community_name(name), 9, '#333', font_weight='500'))
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+            f'viewBox="{-width / 2} {-BAR_CHART_TOP} {width} {height}">{"".join(parts)}</svg>')
+
+def get_chart_svg(dataset, data_name, columns, chart_type, max_value):
+    """获取社区图表的SVG片段及ETag，按 (数据版本, 社区, 数据列, 图表类型, 最大值) 缓存"""
+    key = (dataset['version'], data_name, tuple(columns), chart_type, max_value)
+    with cache_lock:
+        if key in chart_cache:
+            chart_cache.move_to_end(key)
+            return chart_cache[key]
+
+    record_columns = dataset['communities'][data_name].get('columns', {})
+    values = [(record_columns.get(col, {}).get('people_count', 0), CHART_COLORS[index % len(CHART_COLORS)])
+              for index, col in enumerate(columns)]
+    if chart_type == 'pie':
+        svg = render_pie_chart_svg(data_name, values)
+    else:
+        svg = render_bar_chart_svg(data_name, values, max_value)
+    chart = {'svg': svg, 'etag': hashlib.sha1(svg.encode('utf-8')).hexdigest()}
+
+    with cache_lock:
+        chart_cache[key] = chart
+        while len(chart_cache) > MAX_CACHED_CHARTS:
+            chart_cache.popitem(last=False)
+    return chart
+
+def iter_export_rows(data, names, columns):
+    """逐行生成导出内容：表头、每个社区一行人数、最后一行合计"""
+    yield ['社区/村'] + columns + ['总人数']
+
+    totals = [0] * len(columns)
+    for name in names:
+        if name not in data:
+            continue
+        record_columns = data[name].get('columns', {})
+        counts = [record_columns.get(col, {}).get('people_count', 0) for col in columns]
+        for i, count in enumerate(counts):
+            totals[i] += count
+        yield [name] + counts + [sum(counts)]
+
+    yield ['合计'] + totals + [sum(totals)]
+
+def stream_export_csv(rows):
+    """按块生成CSV内容，带BOM以便Excel正确识别中文"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    yield '\ufeff'.encode('utf-8')
+    for i, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if i % EXPORT_CHUNK_ROWS == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+def stream_export_xlsx(rows):
+    """用openpyxl只写模式逐行写入临时文件，再分块读出，内存占用与行数无关"""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('导出数据')
+    for row in rows:
+        sheet.append(row)
+
+    with tempfile.TemporaryFile() as temp_file:
+        workbook.save(temp_file)
+        temp_file.seek(0)
+        while True:
+            chunk = temp_file.read(64 * 1024)
+            if not chunk:
+                break
+            yield chunk
+
+@app.route('/api/export', methods=['GET', 'POST'])
+def export_communities():
+    """导出选中社区各数据列的人数及合计，支持CSV和xlsx
+
+    参数: names 社区列表（默认全部），columns 数据列（默认全部），format 为 csv 或 xlsx
+    """
+    try:
+        export_format = str(get_request_value('format', 'csv')).lower()
+        if export_format not in ('csv', 'xlsx'):
+            return jsonify({'error': '导出格式只支持 csv 和 xlsx'}), 400
+
+        data = get_current_community_data()
+        if not data:
+            return jsonify({'error': '没有可导出的数据，请先上传文件'}), 400
+
+        requested_names = get_request_list('names') or list(data.keys())
+        # 地图上的社区名需要解析为数据中的名称；导出时统一使用数据中的名称
+        names = []
+        for name in requested_names:
+            data_name = resolve_community_name(name, data)
+            if data_name is not None and data_name not in names:
+                names.append(data_name)
+
+        columns = get_request_list('columns') or get_data_columns(data)
+
+        rows = iter_export_rows(data, names, columns)
+        base_name = os.path.splitext(current_filename or '社区数据')[0]
+        download_name = f'{base_name}_导出.{export_format}'
+
+        if export_format == 'csv':
+            body = stream_export_csv(rows)
+            mimetype = 'text/csv'
+        else:
+            body = stream_export_xlsx(rows)
+            mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+        logger.info(f"导出 {len(names)} 个社区、{len(columns)} 列数据为 {export_format}")
+        return Response(
+            stream_with_context(body),
+            mimetype=mimetype,
+            headers={'Content-Disposition': f"attachment; filename=export.{export_format}; "
+                                            f"filename*=UTF-8''{quote(download_name)}"}
+        )
+    except Exception as e:
+        logger.error(f"导出数据失败: {str(e)}")
+        return jsonify({'error': f'导出数据失败：{str(e)}'}), 500
+
+@app.route('/api/query', methods=['GET', 'POST'])
+def query_communities():
+    """按数据列过滤、排序并取前k个社区
+
+    参数: filters 过滤条件（如 低保>50），columns 数据列（默认全部），sort 排序列（默认总人数），
+    order 为 desc 或 asc，limit 返回的社区数（默认全部）
+    """
+    try:
+        dataset = current_dataset
+        if dataset is None or not dataset['communities']:
+            return jsonify({'error': '没有可查询的数据，请先上传文件'}), 400
+
+        order = str(get_request_value('order', 'desc')).lower()
+        if order not in ('desc', 'asc'):
+            return jsonify({'error': '排序方向只支持 desc 和 asc'}), 400
+        limit = get_request_value('limit')
+        if isinstance(limit, (list, dict, bool)):
+            raise ValueError('limit 必须是整数')
+        limit = max(0, int(limit)) if limit not in (None, '') else None
+        filters = parse_query_filters(get_request_list('filters'))
+        columns = get_request_list('columns')
+        # JSON请求体中的参数可能是任意类型，必须是字符串才能作为列名和缓存键
+        if columns is not None and not all(isinstance(col, str) for col in columns):
+            raise ValueError('columns 必须是数据列名的列表')
+        sort = get_request_value('sort')
+        if sort is not None and not isinstance(sort, str):
+            raise ValueError('sort 必须是数据列名')
+
+        key = (dataset['version'], tuple(filters), tuple(columns or ()), sort, order, limit)
+        with cache_lock:
+            if key in query_cache:
+                query_cache.move_to_end(key)
+                return jsonify(query_cache[key])
+
+        result = run_community_query(dataset, filters, columns, sort, order, limit)
+
+        with cache_lock:
+            query_cache[key] = result
+            while len(query_cache) > MAX_CACHED_QUERIES:
+                query_cache.popitem(last=False)
+        return jsonify(result)
+    except ValueError as e:
+        return jsonify({'error': f'查询条件不正确：{str(e)}'}), 400
+    except Exception as e:
+        logger.error(f"查询社区数据失败: {str(e)}")
+        return jsonify({'error': f'查询社区数据失败：{str(e)}'}), 500
+
+@app.route('/api/history')
+def get_history_snapshots():
+    """获取历次上传的快照列表"""
+    try:
+        with history_lock:
+            index = load_history_index()
+            snapshots = [{
+                'id': snapshot['id'],
+                'uploaded_at': snapshot['uploaded_at'],
+                'filename': snapshot['filename'],
+                'template': snapshot['template'],
+                'columns': index['templates'][snapshot['template']],
+                'community_count': len(snapshot['names'])
+            } for snapshot in index['snapshots']]
+        return jsonify({'snapshots': snapshots})
+    except Exception as e:
+        logger.error(f"获取历史快照失败: {str(e)}")
+        return jsonify({'error': f'获取历史快照失败：{str(e)}'}), 500
+
+@app.route('/api/history/<community_name>')
+def get_history_series(community_name):
+    """获取社区在历次上传中的人数时间序列，支持 columns 参数"""
+    try:
+        columns = parse_list_arg('columns')
+        result = get_community_history(community_name, columns)
+        if result is None:
+            # 地图上的社区名先解析为当前数据中的名称再查
+            data_name = resolve_community_name(community_name, get_current_community_data())
+            if data_name is not None:
+                result = get_community_history(data_name, columns)
+        if result is None:
+            return jsonify({'error': '没有该社区的历史数据'}), 404
+        return jsonify(result)
+    except Exception as e:
+        logger.error(f"获取社区历史数据失败: {str(e)}")
+        return jsonify({'error': f'获取社区历史数据失败：{str(e)}'}), 500
+
+@app.route('/api/chart/<community_name>.svg')
+def get_community_chart(community_name):
+    """获取社区的饼图或柱状图SVG片段
+
+    参数: type 为 pie 或 bar，columns 数据列，max 柱状图归一化用的最大值（默认为该社区的最大值），
+    v 数据版本号（与当前版本一致时允许浏览器长期缓存）
+    """
+    try:
+        dataset = current_dataset
+        if dataset is None:
+            return jsonify({'error': '未找到该社区数据'}), 404
+        data_name = resolve_community_name(community_name, dataset['communities'])
+        if data_name is None:
+            return jsonify({'error': '未找到该社区数据'}), 404
+
+        chart_type = request.args.get('type', 'bar')
+        if chart_type not in ('pie', 'bar'):
+            return jsonify({'error': '图表类型只支持 pie 和 bar'}), 400
+        columns = parse_list_arg('columns')
+        if not columns:
+            return jsonify({'error': '请指定数据列'}), 400
+
+        max_value = 0
+        if chart_type == 'bar':
+            record_columns = dataset['communities'][data_name].get('columns', {})
+            max_value = request.args.get('max', type=int) or max(
+                record_columns.get(col, {}).get('people_count', 0) for col in columns)
+
+        chart = get_chart_svg(dataset, data_name, columns, chart_type, max_value)
+        response = Response(chart['svg'], mimetype='image/svg+xml')
+        response.set_etag(chart['etag'])
+        if request.args.get('v') == str(dataset['version']):
+            # 同一版本的图表内容不会变化
+            response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        else:
+            response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
+    except Exception as e:
+        logger.error(f"生成社区图表失败: {str(e)}")
+        return jsonify({'error': f'生成社区图表失败：{str(e)}'}), 500
+
+@app.route('/api/debug/log')
+def get_debug_log():
+    """查看内存中最近的日志
+
+    参数: level 最低级别（默认DEBUG），source 日志来源（如 ingestion 只看文件解析），
+    since 只返回编号更大的记录（用于轮询），limit 最多返回的条数（默认200）
+    """
+    try:
+        min_level = logging.getLevelName(request.args.get('level', 'DEBUG').upper())
+        if not isinstance(min_level, int):
+            return jsonify({'error': '日志级别只支持 DEBUG、INFO、WARNING、ERROR'}), 400
+        entries = log_ring_handler.snapshot(
+            since=request.args.get('since', 0, type=int),
+            min_level=min_level,
+            source=request.args.get('source'),
+            limit=max(1, request.args.get('limit', 200, type=int))
+        )
+        return jsonify({'entries': entries, 'last_id': log_ring_handler.sequence})
+    except Exception as e:
+        logger.error(f"获取日志失败: {str(e)}")
+        return jsonify({'error': f'获取日志失败：{str(e)}'}), 500
+
+@app.route('/api/communities/batch', methods=['POST'])
+def get_communities_batch():
+    """批量获取指定社区的数据，只返回请求的字段
+
+    请求体: {"names": [...], "columns": [...], "fields": [...], "column_fields": [...]}
+    除names外均可省略，省略时返回全部
+    """
+    try:
+        payload = request.get_json(silent=True) or {}
+        names = payload.get('names')
+        if not isinstance(names, list):
+            return jsonify({'error': '请提供社区名称列表 names'}), 400
+
+        columns = payload.get('columns')
+        fields = payload.get('fields')
+        column_fields = payload.get('column_fields')
+        for option in (columns, fields, column_fields):
+            if option is not None and not isinstance(option, list):
+                return jsonify({'error': 'columns / fields / column_fields 必须是列表'}), 400
+
+        data = get_current_community_data()
+        communities = {}
+        missing = []
+        for name in names:
+            data_name = resolve_community_name(name, data)
+            if data_name is None:
+                missing.append(name)
+                continue
+            communities[name] = project_community_record(data[data_name], columns, fields, column_fields)
+
+        return jsonify({'communities': communities, 'missing': missing})
+    except Exception as e:
+        logger.error(f"批量获取社区数据失败: {str(e)}")
+        return jsonify({'error': f'批量获取社区数据失败：{str(e)}'}), 500
+
+def wait_for_server(host, port, timeout=30):
+    """等待服务器开始接受连接，超时返回False"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=0.5):
+                return True
+        except OSError:
+            time.sleep(0.05)
+    return False
+
 def open_browser():
-    """延迟打开浏览器"""
-    time.sleep(1.5)  # 等待Flask启动
-    print(f"[INFO] 正在打开浏览器访问 http://localhost:5001")
-    webbrowser.open('http://localhost:5001')
+    """服务器开始接受连接后立即打开浏览器"""
+    if not wait_for_server('127.0.0.1', SERVER_PORT):
+        logger.warning(f"等待服务器启动超时，请手动访问 http://localhost:{SERVER_PORT}")
+        return
+    logger.info(f"正在打开浏览器访问 http://localhost:{SERVER_PORT}")
+    webbrowser.open(f'http://localhost:{SERVER_PORT}')
+
+def preload_ingestion_modules():
+    """在后台预先导入解析依赖，用户选择文件期间完成，不阻塞启动"""
+    if not wait_for_server('127.0.0.1', SERVER_PORT):
+        return
+    start = time.time()
+    for module_name in INGESTION_MODULES:
+        try:
+            importlib.import_module(module_name)
+        except ImportError as e:
+            logger.warning(f"预加载 {module_name} 失败: {e}")
+    logger.info(f"解析依赖已在后台加载，耗时 {time.time() - start:.2f} 秒")
+
+def get_app_directory():
+    """程序所在目录，打包后为exe所在目录"""
+    if getattr(sys, 'frozen', False):
+        return os.path.dirname(sys.executable)
+    return os.path.dirname(os.path.abspath(__file__))
+
+def scan_watch_directory(directory):
+    """列出监视目录中可解析的文件及其 (修改时间, 大小)"""
+    signatures = {}
+    try:
+        entries = list(os.scandir(directory))
+    except OSError as e:
+        logger.warning(f"无法读取监视目录 {directory}: {e}")
+        return signatures
+
+    for entry in entries:
+        # 跳过Excel打开文件时生成的 ~$ 锁文件和隐藏文件
+        if entry.name.startswith(('~$', '.')) or not allowed_file(entry.name):
+            continue
+        try:
+            if entry.is_file():
+                stat = entry.stat()
+                signatures[entry.path] = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            continue
+    return signatures
+
+def ingest_watched_file(path, digests):
+    """读取监视目录中的文件并发布，内容与上次成功发布时相同则跳过，读取失败返回False
+
+    文件无法解析时不发布，也不记录摘要，文件再次变化时重新处理
+    """
+    try:
+        with open(path, 'rb') as f:
+            file_data = f.read()
+    except OSError as e:
+        logger.warning(f"读取监视文件失败 {path}: {e}")
+        return False
+
+    digest = hashlib.sha1(file_data).hexdigest()
+    if digests.get(path) == digest:
+        logger.info(f"监视文件内容未变化，跳过: {os.path.basename(path)}")
+        return True
+
+    logger.info(f"监视目录发现新数据: {os.path.basename(path)}")
+    # 发布成功后才记录摘要；发布出错时异常交给调用方，文件会在下次轮询时重试
+    if publish_dataset(file_data, os.path.basename(path), digest=digest) is not None:
+        digests[path] = digest
+    return True
+
+def watch_directory(directory, interval=WATCH_POLL_SECONDS, debounce=WATCH_DEBOUNCE_SECONDS):
+    """轮询目录中新增或变化的文件，修改时间和大小在 debounce 秒内不再变化后，发布其中最新的一个"""
+    logger.info(f"监视目录: {directory}（每 {interval} 秒检查一次）")
+    ingested = {}  # 路径 -> 已处理的 (修改时间, 大小)
+    digests = {}   # 路径 -> 已处理内容的sha1
+    pending = {}   # 路径 -> (最近看到的 (修改时间, 大小), 从何时起不再变化)
+
+    while True:
+        try:
+            now = time.time()
+            signatures = scan_watch_directory(directory)
+            for path in list(pending):
+                if path not in signatures:
+                    del pending[path]
+            for path, signature in signatures.items():
+                if ingested.get(path) == signature:
+                    continue
+                if path not in pending or pending[path][0] != signature:
+                    pending[path] = (signature, now)
+
+            # 写入完成的文件中只发布修改时间最新的一个，其余视为已处理
+            ready = sorted((path for path, (_, since) in pending.items() if now - since >= debounce),
+                           key=lambda path: pending[path][0][0])
+            if ready:
+                newest = ready[-1]
+                for path in ready[:-1]:
+                    logger.info(f"监视目录中有更新的文件，跳过: {os.path.basename(path)}")
+                    ingested[path] = pending.pop(path)[0]
+                signature = pending.pop(newest)[0]
+                if ingest_watched_file(newest, digests):
+                    ingested[newest] = signature
+        except Exception as e:
+            logger.error(f"监视目录出错: {e}")
+        time.sleep(interval)
+
+def start_directory_watcher(directory, interval=WATCH_POLL_SECONDS):
+    """在后台线程中监视目录"""
+    directory = os.path.join(get_app_directory(), directory)
+    os.makedirs(directory, exist_ok=True)
+    threading.Thread(target=watch_directory, args=(directory, interval), daemon=True).start()
+
+def serve_workers(worker_count, host, port, background_tasks=()):
+    """预先绑定监听套接字并fork出多个工作进程共同处理请求，数据集通过共享目录中的内存映射文件共享
+
+    主进程不处理请求，也不运行任何后台线程，只负责重启意外退出的子进程。
+    background_tasks（如目录监视）在单独的后台任务子进程中运行：主进程重启工作进程时要再次fork，
+    若主进程中有线程正持有 cache_lock、history_lock 等锁，fork出的子进程会继承被占用的锁而死锁
+    """
+    global shared_store_directory
+    from werkzeug.serving import make_server
+
+    shared_store_directory = tempfile.mkdtemp(prefix='community_map_')
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((host, port))
+    listener.listen(128)
+    master_pid = os.getpid()
+
+    def spawn_worker(worker_index):
+        # fork前停止日志线程，子进程和主进程各自重新启动
+        log_listener.stop()
+        pid = os.fork()
+        log_listener.start()
+        if pid != 0:
+            return pid
+
+        exit_code = 0
+        try:
+            signal.signal(signal.SIGTERM, signal.default_int_handler)
+            if worker_index == BACKGROUND_WORKER_INDEX:
+                run_background_tasks(background_tasks, master_pid)
+                return
+            threading.Thread(target=poll_shared_manifest, args=(master_pid,), daemon=True).start()
+            threading.Thread(target=preload_ingestion_modules, daemon=True).start()
+            server = make_server(host, port, app, threaded=True, fd=listener.fileno())
+            logger.info(f"工作进程 {worker_index} 已启动 (pid {os.getpid()})")
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        except Exception as e:
+            logger.error(f"工作进程 {worker_index} 异常退出: {e}")
+            exit_code = 1
+        finally:
+            log_listener.stop()
+            os._exit(exit_code)
+
+    # systemd、docker、kill 发送的SIGTERM与Ctrl+C一样按KeyboardInterrupt处理，保证下面的清理一定执行
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    workers = {}
+    try:
+        for worker_index in range(worker_count):
+            workers[spawn_worker(worker_index)] = worker_index
+        if background_tasks:
+            workers[spawn_worker(BACKGROUND_WORKER_INDEX)] = BACKGROUND_WORKER_INDEX
+        logger.info(f"已启动 {worker_count} 个工作进程，共享数据目录: {shared_store_directory}")
+
+        while workers:
+            pid, status = os.wait()
+            worker_index = workers.pop(pid, None)
+            if worker_index is None or os.waitstatus_to_exitcode(status) == 0:
+                continue
+            logger.warning(f"工作进程 {worker_index} 意外退出 (状态 {os.waitstatus_to_exitcode(status)})，正在重新启动")
+            workers[spawn_worker(worker_index)] = worker_index
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # 清理期间不再响应信号，避免再次中断导致共享目录（含上传名单的副本）残留
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        stop_workers(workers)
+        listener.close()
+        shutil.rmtree(shared_store_directory, ignore_errors=True)
+        logger.info(f"所有工作进程已退出，已删除共享数据目录")
+
+def run_background_tasks(background_tasks, parent_pid):
+    """后台任务子进程：启动目录监视等后台线程，主进程退出后随之退出"""
+    logger.info(f"后台任务进程已启动 (pid {os.getpid()})")
+    for task in background_tasks:
+        task()
+    while os.getppid() == parent_pid:
+        time.sleep(SHARED_POLL_SECONDS)
+    logger.warning(f"主进程已退出，后台任务进程 (pid {os.getpid()}) 随之退出")
+
+def stop_workers(workers):
+    """向工作进程转发SIGTERM并等待退出，超时仍未退出的强制结束"""
+    for pid in workers:
+        with contextlib.suppress(OSError):
+            os.kill(pid, signal.SIGTERM)
+
+    deadline = time.time() + WORKER_SHUTDOWN_SECONDS
+    for pid in workers:
+        try:
+            while os.waitpid(pid, os.WNOHANG) == (0, 0):
+                if time.time() >= deadline:
+                    logger.warning(f"工作进程 (pid {pid}) 未能按时退出，强制结束")
+                    os.kill(pid, signal.SIGKILL)
+                    os.waitpid(pid, 0)
+                    break
+                time.sleep(0.05)
+        except ChildProcessError:
+            pass
+
+def parse_command_line():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='社区地图信息查询系统')
+    parser.add_argument('--watch', nargs='?', const=DEFAULT_WATCH_DIRECTORY, metavar='目录',
+                        help=f'监视目录中新增或变化的Excel/CSV文件并自动发布最新的一个（默认目录 {DEFAULT_WATCH_DIRECTORY}）')
+    parser.add_argument('--watch-interval', type=float, default=WATCH_POLL_SECONDS, metavar='秒',
+                        help='监视目录的轮询间隔')
+    parser.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                        help='控制台日志级别（/api/debug/log 始终保留DEBUG级别的记录）')
+    parser.add_argument('--history-dir', default=HISTORY_DIRECTORY, metavar='目录',
+                        help=f'历史快照目录，相对路径相对于程序所在目录（默认 {HISTORY_DIRECTORY}）')
+    parser.add_argument('--no-history', action='store_true', help='不记录历史快照')
+    parser.add_argument('--workers', type=int, default=1, metavar='N',
+                        help='工作进程数，大于1时以多进程模式运行并共享解析后的数据（需要支持fork的系统）')
+    return parser.parse_args()
 
 if __name__ == '__main__':
-    print(f"[INFO] 应用启动，等待用户上传Excel文件")
+    args = parse_command_line()
+    log_console_handler.setLevel(args.log_level)
+    app.config['HISTORY_DIRECTORY'] = None if args.no_history else args.history_dir
+    logger.info(f"应用启动，等待用户上传Excel文件")
+    if args.workers > 1 and not hasattr(os, 'fork'):
+        logger.warning(f"当前系统不支持fork，忽略 --workers {args.workers}，以单进程模式运行")
+        args.workers = 1
 
     # 检查是否是打包后的exe
     if getattr(sys, 'frozen', False):
-        print(f"[INFO] 检测到打包环境，以生产模式运行")
-        # 在新线程中打开浏览器
-        threading.Timer(1.5, open_browser).start()
-        print(f"[INFO] 正在启动应用...")
-        print(f"[INFO] 浏览器将自动打开访问 http://localhost:5001")
-        print(f"[INFO] 如果浏览器未自动打开，请手动访问上述地址")
-        app.run(debug=False, host='127.0.0.1', port=5001, use_reloader=False)
+        logger.info(f"检测到打包环境，以生产模式运行")
+        # 在新线程中等待服务器就绪后打开浏览器，并在后台加载解析依赖
+        logger.info(f"正在启动应用...")
+        logger.info(f"浏览器将自动打开访问 http://localhost:{SERVER_PORT}")
+        logger.info(f"如果浏览器未自动打开，请手动访问上述地址")
+        if args.workers > 1:
+            # 后台线程在单独的后台任务子进程中启动
+            tasks = [lambda: threading.Thread(target=open_browser, daemon=True).start()]
+            if args.watch:
+                tasks.append(lambda: start_directory_watcher(args.watch, args.watch_interval))
+            serve_workers(args.workers, '127.0.0.1', SERVER_PORT, tasks)
+        else:
+            threading.Thread(target=open_browser, daemon=True).start()
+            threading.Thread(target=preload_ingestion_modules, daemon=True).start()
+            if args.watch:
+                start_directory_watcher(args.watch, args.watch_interval)
+            app.run(debug=False, host='127.0.0.1', port=SERVER_PORT, use_reloader=False)
     else:
-        print(f"[INFO] 检测到开发环境，以调试模式运行")
-        print(f"[INFO] 应用将在 http://0.0.0.0:5001 上运行")
-        # 开发环境
-        app.run(debug=True, host='0.0.0.0', port=5001)
\ No newline at end of file
+        logger.info(f"检测到开发环境，以调试模式运行")
+        logger.info(f"应用将在 http://0.0.0.0:{SERVER_PORT} 上运行")
+        if args.workers > 1:
+            # 多进程模式不使用调试重载器
+            tasks = [lambda: start_directory_watcher(args.watch, args.watch_interval)] if args.watch else []
+            serve_workers(args.workers, '0.0.0.0', SERVER_PORT, tasks)
+        else:
+            # 调试模式下重载器的父进程不处理请求，只在子进程中监视目录
+            if args.watch and os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+                start_directory_watcher(args.watch, args.watch_interval)
+            # 开发环境
+            app.run(debug=True, host='0.0.0.0', port=SERVER_PORT)
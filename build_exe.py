@@ -12,6 +12,81 @@ import platform
 import argparse
 from pathlib import Path
 
+# 应用用不到的模块，打包时排除以减小体积、加快启动
+BUNDLE_EXCLUDES = [
+    'tkinter',
+    'matplotlib',
+    'scipy',
+    'IPython',
+    'jupyter',
+    'notebook',
+    'PyQt5',
+    'PyQt6',
+    'PySide2',
+    'PySide6',
+    'pytest',
+    'sphinx',
+    'docutils',
+    'sqlalchemy',
+    'pyarrow',
+    'numba',
+    'tables',
+    'lxml',
+    'bs4',
+    'html5lib',
+    'pandas.tests',
+    'numpy.tests',
+    'numpy.f2py',
+]
+
+def format_excludes(excludes):
+    """把排除模块列表格式化为spec文件中的excludes配置"""
+    lines = ''.join(f"        '{name}',\n" for name in excludes)
+    return f"excludes=[\n{lines}    ],"
+
+def report_import_times(top=15):
+    """统计导入app.py时各模块的累计耗时（python -X importtime）"""
+    script_dir = Path(__file__).parent.absolute()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=str(script_dir),
+        text=True,
+        capture_output=True
+    )
+    if result.returncode != 0:
+        print("导入app.py失败:")
+        print(result.stderr)
+        return 1
+
+    # 每行格式: import time: self [us] | cumulative | imported package
+    # 模块名前每两个空格表示一层嵌套，子模块先于导入它的模块输出
+    children = []      # 当前顶层模块的直接子导入
+    app_children = []
+    app_total = 0
+    app_self = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3:
+            continue
+        cumulative = int(parts[1].strip())
+        module = parts[2][1:].rstrip()
+        depth = (len(module) - len(module.lstrip(' '))) // 2
+        if depth == 1:
+            children.append((cumulative, module.strip()))
+        elif depth == 0:
+            # 只统计app.py直接导入的模块，解释器启动时的 site、encodings 等不计入
+            if module == 'app':
+                app_self, app_total, app_children = int(parts[0].strip()), cumulative, children
+            children = []
+
+    print(f"导入app.py总耗时: {app_total / 1000:.1f}ms（其中执行app.py本身 {app_self / 1000:.1f}ms）")
+    print(f"app.py直接导入的模块中耗时最多的前{top}个:")
+    for cumulative, module in sorted(app_children, reverse=True)[:top]:
+        print(f"  {cumulative / 1000:8.1f}ms  {module}")
+    return 0
+
 def create_spec_file(show_console=False):
     """创建.spec文件并配置图标和控制台选项"""
     script_dir = Path(__file__).parent.absolute()
@@ -58,7 +133,7 @@ a = Analysis(
     hookspath=[],
     hooksconfig={{}},
     runtime_hooks=[],
-    excludes=[],
+    {format_excludes(BUNDLE_EXCLUDES)}
     win_no_prefer_redirects=False,
     win_private_assemblies=False,
     cipher=block_cipher,
@@ -108,8 +183,13 @@ def main():
                        help='显示控制台窗口（默认不显示）')
     parser.add_argument('--no-clean', action='store_true',
                        help='不清理之前的构建文件')
+    parser.add_argument('--import-report', action='store_true',
+                       help='只输出导入app.py的耗时报告，不打包')
     
     args = parser.parse_args()
+    if args.import_report:
+        return report_import_times()
+
     console_mode = args.console
     clean_build = not args.no_clean
     
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地并发压测脚本
+
+模拟多个用户同时上传各自的名单并查询 /api/communities、/api/community/<社区名>、
+/api/data-quality，统计吞吐量和 p50/p95/p99 延迟，并检查是否读到了其他用户的数据
+（服务器只有一份全局的当前文件，多人同时使用时会互相覆盖）。
+
+用法:
+  python load_harness.py                      # 在本进程内启动应用后压测
+  python load_harness.py --url http://127.0.0.1:5001 --users 50 --duration 60
+"""
+
+import argparse
+import io
+import json
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from pathlib import Path
+from urllib.error import HTTPError
+from urllib.parse import quote
+from urllib.request import Request, urlopen
+
+# 各类请求的权重
+REQUEST_MIX = [
+    ('upload', 1),
+    ('communities', 5),
+    ('community', 3),
+    ('data-quality', 1),
+]
+
+DATA_COLUMNS = ['老年人口', '低保', '特困', '残疾人']
+
+
+def build_workbook(user_id, community_count, rows_per_community):
+    """生成某个用户专属的名单，社区名带用户编号，便于识别数据串号"""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(['村居'] + DATA_COLUMNS)
+    communities = [f'压测{user_id}号{i}村' for i in range(community_count)]
+    for name in communities:
+        for _ in range(rows_per_community):
+            sheet.append([name] + [f'{random.randint(1, 99)}人' for _ in DATA_COLUMNS])
+
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue(), communities
+
+
+def encode_multipart(field_name, filename, content):
+    """构造 multipart/form-data 请求体"""
+    boundary = uuid.uuid4().hex
+    body = io.BytesIO()
+    body.write(f'--{boundary}\r\n'.encode())
+    body.write(f'Content-Disposition: form-data; name="{field_name}"; filename="{filename}"\r\n'.encode())
+    body.write(b'Content-Type: application/vnd.openxmlformats-officedocument.spreadsheetml.sheet\r\n\r\n')
+    body.write(content)
+    body.write(f'\r\n--{boundary}--\r\n'.encode())
+    return body.getvalue(), f'multipart/form-data; boundary={boundary}'
+
+
+def http_request(url, data=None, content_type=None, timeout=60):
+    """发送请求，返回 (状态码, 解析后的JSON或None)"""
+    request = Request(url, data=data, method='POST' if data is not None else 'GET')
+    if content_type:
+        request.add_header('Content-Type', content_type)
+    try:
+        with urlopen(request, timeout=timeout) as response:
+            status = response.status
+            body = response.read()
+    except HTTPError as e:
+        status = e.code
+        body = e.read()
+    try:
+        return status, json.loads(body.decode('utf-8'))
+    except ValueError:
+        return status, None
+
+
+class LoadStats:
+    """线程安全地收集各接口的延迟、错误和串号记录"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.mixups = defaultdict(int)
+        self.mixup_examples = []
+
+    def record(self, endpoint, latency, ok):
+        with self.lock:
+            self.latencies[endpoint].append(latency)
+            if not ok:
+                self.errors[endpoint] += 1
+
+    def record_mixup(self, endpoint, detail):
+        with self.lock:
+            self.mixups[endpoint] += 1
+            if len(self.mixup_examples) < 10:
+                self.mixup_examples.append(f'{endpoint}: {detail}')
+
+
+def percentile(sorted_values, fraction):
+    """最近秩法计算分位数"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class SimulatedUser(threading.Thread):
+    """一个模拟用户：先上传自己的名单，然后按权重随机发起请求"""
+
+    def __init__(self, user_id, base_url, stats, deadline, workbook, communities):
+        super().__init__(daemon=True)
+        self.user_id = user_id
+        self.base_url = base_url
+        self.stats = stats
+        self.deadline = deadline
+        self.workbook = workbook
+        self.communities = communities
+        self.filename = f'压测用户{user_id}.xlsx'
+        self.rng = random.Random(user_id)
+
+    def run(self):
+        self.upload()
+        actions = [name for name, weight in REQUEST_MIX for _ in range(weight)]
+        while time.time() < self.deadline:
+            action = self.rng.choice(actions)
+            if action == 'upload':
+                self.upload()
+            elif action == 'communities':
+                self.fetch_communities()
+            elif action == 'community':
+                self.fetch_community()
+            else:
+                self.fetch_data_quality()
+
+    def timed(self, endpoint, url, data=None, content_type=None):
+        start = time.perf_counter()
+        try:
+            status, payload = http_request(url, data, content_type)
+        except OSError:
+            status, payload = None, None
+        self.stats.record(endpoint, time.perf_counter() - start, status == 200)
+        return status, payload
+
+    def upload(self):
+        body, content_type = encode_multipart('file', self.filename, self.workbook)
+        self.timed('/api/upload', f'{self.base_url}/api/upload', body, content_type)
+
+    def fetch_communities(self):
+        status, payload = self.timed('/api/communities', f'{self.base_url}/api/communities')
+        if status == 200 and isinstance(payload, dict):
+            foreign = [name for name in payload if name not in self.communities]
+            if foreign or len(payload) != len(self.communities):
+                self.stats.record_mixup('/api/communities',
+                                        f'用户{self.user_id}读到了其他数据，例如 {foreign[:1]}')
+
+    def fetch_community(self):
+        name = self.rng.choice(self.communities)
+        status, payload = self.timed('/api/community/<community_name>',
+                                     f'{self.base_url}/api/community/{quote(name)}')
+        if status == 404:
+            self.stats.record_mixup('/api/community/<community_name>',
+                                    f'用户{self.user_id}自己的社区 {name} 不存在')
+        elif status == 200 and isinstance(payload, dict) and payload.get('name') != name:
+            self.stats.record_mixup('/api/community/<community_name>',
+                                    f'用户{self.user_id}请求 {name} 却得到 {payload.get("name")}')
+
+    def fetch_data_quality(self):
+        status, payload = self.timed('/api/data-quality', f'{self.base_url}/api/data-quality')
+        if status == 200 and isinstance(payload, dict) and payload.get('filename') != self.filename:
+            self.stats.record_mixup('/api/data-quality',
+                                    f'用户{self.user_id}得到了 {payload.get("filename")} 的质量报告')
+
+
+def start_in_process_server(history_dir):
+    """在本进程内启动应用，返回 (访问地址, 服务器对象)；压测上传的历史快照写入 history_dir"""
+    from werkzeug.serving import make_server
+
+    sys.path.insert(0, str(Path(__file__).parent))
+    from app import app
+
+    app.config['HISTORY_DIRECTORY'] = history_dir
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}', server
+
+
+def print_report(stats, elapsed, users):
+    """输出吞吐量、延迟分位数和串号统计"""
+    total = sum(len(values) for values in stats.latencies.values())
+    print(f"\n并发用户: {users}，持续 {elapsed:.1f} 秒，共 {total} 个请求，吞吐量 {total / elapsed:.1f} 请求/秒")
+    print(f"{'接口':<34}{'请求数':>8}{'错误':>6}{'串号':>6}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}")
+    for endpoint in sorted(stats.latencies):
+        values = sorted(stats.latencies[endpoint])
+        print(f"{endpoint:<34}{len(values):>8}{stats.errors[endpoint]:>6}{stats.mixups[endpoint]:>6}"
+              f"{percentile(values, 0.50) * 1000:>10.1f}"
+              f"{percentile(values, 0.95) * 1000:>10.1f}"
+              f"{percentile(values, 0.99) * 1000:>10.1f}")
+
+    total_mixups = sum(stats.mixups.values())
+    if total_mixups:
+        print(f"\n⚠️ 检测到 {total_mixups} 次跨用户数据串号（全局 current_file_data 被其他用户的上传覆盖）:")
+        for example in stats.mixup_examples:
+            print(f"   - {example}")
+    else:
+        print("\n✅ 未检测到跨用户数据串号")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='社区地图应用本地并发压测')
+    parser.add_argument('--url', help='压测已运行的服务器，例如 http://127.0.0.1:5001；默认在本进程内启动应用')
+    parser.add_argument('--users', type=int, default=20, help='并发用户数')
+    parser.add_argument('--duration', type=float, default=30, help='持续时间（秒）')
+    parser.add_argument('--communities', type=int, default=10, help='每个用户名单中的社区数')
+    parser.add_argument('--rows', type=int, default=5, help='每个社区的行数')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    server = None
+    history_dir = None
+    if args.url:
+        base_url = args.url.rstrip('/')
+    else:
+        # 压测数据不写入正式的历史记录
+        history_dir = tempfile.mkdtemp(prefix='load_harness_history_')
+        base_url, server = start_in_process_server(history_dir)
+    print(f"压测目标: {base_url}")
+
+    print(f"正在生成 {args.users} 份测试名单...")
+    workbooks = [build_workbook(user_id, args.communities, args.rows) for user_id in range(args.users)]
+
+    stats = LoadStats()
+    start = time.time()
+    deadline = start + args.duration
+    users = [SimulatedUser(user_id, base_url, stats, deadline, workbook, communities)
+             for user_id, (workbook, communities) in enumerate(workbooks)]
+    for user in users:
+        user.start()
+    for user in users:
+        user.join()
+
+    print_report(stats, time.time() - start, args.users)
+
+    if server is not None:
+        server.shutdown()
+        shutil.rmtree(history_dir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -13,6 +13,7 @@ a = Analysis(
         'pandas',
         'openpyxl',
         'flask',
+        'xlrd',
         'werkzeug',
         'jinja2',
         'click',
@@ -29,7 +30,31 @@ a = Analysis(
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    excludes=[
+        'tkinter',
+        'matplotlib',
+        'scipy',
+        'IPython',
+        'jupyter',
+        'notebook',
+        'PyQt5',
+        'PyQt6',
+        'PySide2',
+        'PySide6',
+        'pytest',
+        'sphinx',
+        'docutils',
+        'sqlalchemy',
+        'pyarrow',
+        'numba',
+        'tables',
+        'lxml',
+        'bs4',
+        'html5lib',
+        'pandas.tests',
+        'numpy.tests',
+        'numpy.f2py',
+    ],
     win_no_prefer_redirects=False,
     win_private_assemblies=False,
     cipher=block_cipher,
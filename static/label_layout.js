@@ -0,0 +1,212 @@
+// 信息框布局引擎：用均匀网格空间索引批量放置信息框，尽量避免重叠和引线交叉
+// 页面通过 <script> 引入，test_label_layout.py 在node中加载同一份代码
+const LABEL_GRID_CELL_SIZE = 100;
+const INFO_BOX_WIDTH = 160;
+const INFO_BOX_HEIGHT = 90;
+
+// 创建均匀网格空间索引
+function createSpatialGrid(cellSize) {
+    return { cellSize: cellSize, cells: new Map() };
+}
+
+// 矩形覆盖的网格单元
+function gridRectKeys(grid, rect) {
+    const keys = [];
+    const x0 = Math.floor(rect.left / grid.cellSize);
+    const x1 = Math.floor(rect.right / grid.cellSize);
+    const y0 = Math.floor(rect.top / grid.cellSize);
+    const y1 = Math.floor(rect.bottom / grid.cellSize);
+    for (let gx = x0; gx <= x1; gx++) {
+        for (let gy = y0; gy <= y1; gy++) {
+            keys.push(gx + ',' + gy);
+        }
+    }
+    return keys;
+}
+
+// 线段经过的网格单元（沿线段按半个单元步长采样，避免长引线占满整个包围盒）
+function gridSegmentKeys(grid, from, to) {
+    const keys = new Set();
+    const length = Math.hypot(to.x - from.x, to.y - from.y);
+    const steps = Math.max(1, Math.ceil(length / (grid.cellSize / 2)));
+    for (let i = 0; i <= steps; i++) {
+        const x = from.x + (to.x - from.x) * i / steps;
+        const y = from.y + (to.y - from.y) * i / steps;
+        keys.add(Math.floor(x / grid.cellSize) + ',' + Math.floor(y / grid.cellSize));
+    }
+    return Array.from(keys);
+}
+
+function gridInsert(grid, keys, item) {
+    keys.forEach(key => {
+        let bucket = grid.cells.get(key);
+        if (!bucket) {
+            bucket = [];
+            grid.cells.set(key, bucket);
+        }
+        bucket.push(item);
+    });
+}
+
+function gridQuery(grid, keys) {
+    const found = new Set();
+    keys.forEach(key => {
+        const bucket = grid.cells.get(key);
+        if (bucket) bucket.forEach(item => found.add(item));
+    });
+    return found;
+}
+
+// 两个矩形的重叠面积
+function overlapArea(rect1, rect2) {
+    const w = Math.min(rect1.right, rect2.right) - Math.max(rect1.left, rect2.left);
+    const h = Math.min(rect1.bottom, rect2.bottom) - Math.max(rect1.top, rect2.top);
+    return w > 0 && h > 0 ? w * h : 0;
+}
+
+// 判断两条线段是否相交（共享端点不算）
+function segmentsCross(p1, p2, p3, p4) {
+    const cross = (a, b, c) => (b.x - a.x) * (c.y - a.y) - (b.y - a.y) * (c.x - a.x);
+    const d1 = cross(p3, p4, p1);
+    const d2 = cross(p3, p4, p2);
+    const d3 = cross(p1, p2, p3);
+    const d4 = cross(p1, p2, p4);
+    return ((d1 > 0 && d2 < 0) || (d1 < 0 && d2 > 0)) &&
+           ((d3 > 0 && d4 < 0) || (d3 < 0 && d4 > 0));
+}
+
+// 判断线段是否穿过矩形
+function segmentHitsRect(from, to, rect) {
+    const inside = p => p.x > rect.left && p.x < rect.right && p.y > rect.top && p.y < rect.bottom;
+    if (inside(from) || inside(to)) return true;
+    const corners = [
+        { x: rect.left, y: rect.top }, { x: rect.right, y: rect.top },
+        { x: rect.right, y: rect.bottom }, { x: rect.left, y: rect.bottom }
+    ];
+    for (let i = 0; i < 4; i++) {
+        if (segmentsCross(from, to, corners[i], corners[(i + 1) % 4])) return true;
+    }
+    return false;
+}
+
+// 生成候选位置，按偏好代价从小到大排列
+function labelCandidates(anchor, width, height, bounds) {
+    const margin = 10;
+    const gap = 8;
+    const candidates = [];
+    const clampX = x => Math.max(margin, Math.min(x, bounds.width - width - margin));
+    const clampY = y => Math.max(margin, Math.min(y, bounds.height - height - margin));
+
+    // 优先放在地图边缘栏（锚点靠右时先放左侧），沿锚点高度上下错位
+    const rightX = bounds.width - width - 20;
+    const leftX = 20;
+    const columns = anchor.x > bounds.width * 0.7 ? [leftX, rightX] : [rightX, leftX];
+    const maxSteps = Math.ceil(bounds.height / (height + gap));
+    columns.forEach((columnX, columnIndex) => {
+        for (let step = 0; step <= maxSteps; step++) {
+            [1, -1].forEach(sign => {
+                if (step === 0 && sign < 0) return;
+                const offset = sign * step * (height + gap);
+                candidates.push({
+                    x: clampX(columnX),
+                    y: clampY(anchor.y - height / 2 + offset),
+                    preference: columnIndex * 300 + Math.abs(offset)
+                });
+            });
+        }
+    });
+
+    // 锚点周围的环形位置
+    [60, 120, 200].forEach(radius => {
+        for (let i = 0; i < 8; i++) {
+            const angle = i * Math.PI / 4;
+            candidates.push({
+                x: clampX(anchor.x + radius * Math.cos(angle) - width / 2),
+                y: clampY(anchor.y + radius * Math.sin(angle) - height / 2),
+                preference: 200 + radius
+            });
+        }
+    });
+
+    // 贴边截断后会产生重复位置，只保留偏好代价最小的一个
+    const seen = new Set();
+    return candidates
+        .sort((a, b) => a.preference - b.preference)
+        .filter(candidate => {
+            const key = Math.round(candidate.x) + ',' + Math.round(candidate.y);
+            if (seen.has(key)) return false;
+            seen.add(key);
+            return true;
+        });
+}
+
+// 批量布局信息框
+// requests: [{ name, anchor, width, height }]；fixedBoxes: 已存在且不移动的信息框 [{ name, rect, anchor }]
+// 返回 Map(name -> { x, y })
+function layoutInfoBoxes(requests, bounds, fixedBoxes = []) {
+    const boxGrid = createSpatialGrid(LABEL_GRID_CELL_SIZE);
+    const lineGrid = createSpatialGrid(LABEL_GRID_CELL_SIZE);
+    const placements = new Map();
+
+    const addPlaced = (rect, anchor) => {
+        const center = { x: (rect.left + rect.right) / 2, y: (rect.top + rect.bottom) / 2 };
+        gridInsert(boxGrid, gridRectKeys(boxGrid, rect), { rect: rect });
+        if (anchor) {
+            gridInsert(lineGrid, gridSegmentKeys(lineGrid, anchor, center), { from: anchor, to: center });
+        }
+    };
+
+    fixedBoxes.forEach(box => addPlaced(box.rect, box.anchor));
+
+    // 按锚点纵坐标排序，使边缘栏中的信息框顺序与锚点一致，减少引线交叉
+    const ordered = requests.slice().sort((a, b) => a.anchor.y - b.anchor.y || a.anchor.x - b.anchor.x);
+
+    ordered.forEach(req => {
+        let best = null;
+        let bestCost = Infinity;
+
+        for (const candidate of labelCandidates(req.anchor, req.width, req.height, bounds)) {
+            // 候选位置按偏好排序，偏好代价已超过当前最优时后面不可能更好
+            if (candidate.preference >= bestCost) break;
+
+            const rect = {
+                left: candidate.x,
+                top: candidate.y,
+                right: candidate.x + req.width,
+                bottom: candidate.y + req.height
+            };
+            const center = { x: candidate.x + req.width / 2, y: candidate.y + req.height / 2 };
+
+            let conflict = 0;
+            gridQuery(boxGrid, gridRectKeys(boxGrid, rect)).forEach(item => {
+                conflict += overlapArea(rect, item.rect) * 10;
+            });
+            const lineKeys = gridSegmentKeys(lineGrid, req.anchor, center);
+            gridQuery(lineGrid, lineKeys).forEach(item => {
+                if (segmentsCross(req.anchor, center, item.from, item.to)) conflict += 2000;
+            });
+            gridQuery(boxGrid, lineKeys).forEach(item => {
+                if (segmentHitsRect(req.anchor, center, item.rect)) conflict += 800;
+            });
+
+            const cost = candidate.preference + conflict;
+            if (cost < bestCost) {
+                bestCost = cost;
+                best = { x: candidate.x, y: candidate.y, rect: rect };
+            }
+        }
+
+        placements.set(req.name, { x: best.x, y: best.y });
+        addPlaced(best.rect, req.anchor);
+    });
+
+    return placements;
+}
+
+// 在node中运行测试语料时导出
+if (typeof module !== 'undefined' && module.exports) {
+    module.exports = {
+        LABEL_GRID_CELL_SIZE, INFO_BOX_WIDTH, INFO_BOX_HEIGHT,
+        overlapArea, segmentsCross, segmentHitsRect, labelCandidates, layoutInfoBoxes
+    };
+}
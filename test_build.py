@@ -42,6 +42,7 @@ def test_spec_generation():
             ("应用名称", "name='qxy_app2'" in content),
             ("模板包含", "('templates', 'templates')" in content),
             ("静态文件包含", "('static', 'static')" in content),
+            ("排除无用模块", "'tkinter'" in content and "excludes=[]" not in content),
         ]
 
         for check_name, result in checks:
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+上传历史记录的测试
+
+每次发布的新版本都记录为时间序列上的一个点；只有连续重复上传同一内容时才跳过，
+与更早某次上传相同的数据仍然记录。
+"""
+
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import app
+
+ROSTER_TEMPLATE = '''村居,低保,特困
+海达社区,{}人,1人
+石塘村,3人,0
+'''
+
+
+def publish_months(counts):
+    """在临时历史目录中依次发布各月数据，返回海达社区的低保人数时间序列"""
+    directory = tempfile.mkdtemp(prefix='test_history_')
+    saved = (app.app.config['HISTORY_DIRECTORY'], app.current_dataset, app.history_index)
+    app.app.config['HISTORY_DIRECTORY'] = directory
+    app.current_dataset = None
+    app.history_index = None
+    try:
+        for count in counts:
+            roster = ROSTER_TEMPLATE.format(count).encode('utf-8')
+            assert app.publish_dataset(roster, f'{count}.csv') is not None
+        return app.get_community_history('海达社区', ['低保'])
+    finally:
+        app.app.config['HISTORY_DIRECTORY'], app.current_dataset, app.history_index = saved
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def series(history):
+    return history['series']['低保']
+
+
+def test_repeated_earlier_month_is_recorded():
+    """某月数据与更早某月相同时仍记录，时间序列不出现缺口"""
+    history = publish_months([5, 7, 5])
+    assert series(history) == [5, 7, 5]
+
+
+def test_consecutive_duplicate_is_skipped():
+    """连续重复上传同一内容只记录一次"""
+    history = publish_months([5, 5, 7])
+    assert series(history) == [5, 7]
+
+
+if __name__ == "__main__":
+    tests = [test_repeated_earlier_month_is_recorded, test_consecutive_duplicate_is_skipped]
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__doc__}")
+        except AssertionError as e:
+            print(f"❌ {test.__doc__}: {e}")
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+信息框布局引擎测试
+
+在node中加载页面使用的 static/label_layout.js，按 test_label_layout_cases.json 中的语料
+批量布局信息框，检查越界、重叠、引线交叉和耗时是否符合各场景的预期。
+"""
+
+import json
+import shutil
+import subprocess
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).parent
+LAYOUT_SCRIPT = SCRIPT_DIR / 'static' / 'label_layout.js'
+CASES_FILE = SCRIPT_DIR / 'test_label_layout_cases.json'
+
+# 在node中运行语料，输出每个场景的统计
+NODE_RUNNER = r"""
+const layout = require(process.argv[1]);
+const corpus = require(process.argv[2]);
+const [viewWidth, viewHeight] = corpus.map_view_box;
+
+// 与页面 getElementCenter 相同：地图按比例缩放后居中显示在容器中
+function mapAnchor(name, bounds) {
+    const scale = Math.min(bounds.width / viewWidth, bounds.height / viewHeight);
+    const [x, y] = corpus.map_centers[name];
+    return {
+        x: x * scale + (bounds.width - viewWidth * scale) / 2,
+        y: y * scale + (bounds.height - viewHeight * scale) / 2
+    };
+}
+
+// 可复现的伪随机锚点
+function syntheticAnchors(count, seed, bounds) {
+    let state = seed;
+    const next = () => (state = (state * 1103515245 + 12345) % 2147483648) / 2147483648;
+    const anchors = {};
+    for (let i = 0; i < count; i++) {
+        anchors['锚点' + i] = { x: bounds.width * (0.25 + next() * 0.5), y: bounds.height * next() };
+    }
+    return anchors;
+}
+
+const toRequest = (name, anchor) => ({
+    name: name, anchor: anchor, width: layout.INFO_BOX_WIDTH, height: layout.INFO_BOX_HEIGHT
+});
+const toBox = (req, position) => ({
+    anchor: req.anchor,
+    rect: { left: position.x, top: position.y, right: position.x + req.width, bottom: position.y + req.height },
+    center: { x: position.x + req.width / 2, y: position.y + req.height / 2 }
+});
+
+const results = corpus.cases.map(testCase => {
+    const bounds = { width: testCase.bounds[0], height: testCase.bounds[1] };
+    let requests;
+    if (testCase.synthetic) {
+        const anchors = syntheticAnchors(testCase.synthetic.count, testCase.synthetic.seed, bounds);
+        requests = Object.entries(anchors).map(([name, anchor]) => toRequest(name, anchor));
+    } else {
+        const names = testCase.select === 'all' ? Object.keys(corpus.map_centers) : testCase.select;
+        requests = names.map(name => toRequest(name, mapAnchor(name, bounds)));
+    }
+
+    // 已有信息框先单独布局，再作为障碍物参与新一批的布局
+    const fixedRequests = (testCase.fixed || []).map(name => toRequest(name, mapAnchor(name, bounds)));
+    const fixedLayout = layout.layoutInfoBoxes(fixedRequests, bounds);
+    const fixedBoxes = fixedRequests.map(req => Object.assign({ name: req.name }, toBox(req, fixedLayout.get(req.name))));
+
+    const start = process.hrtime.bigint();
+    const placements = layout.layoutInfoBoxes(requests, bounds, fixedBoxes);
+    const elapsed = Number(process.hrtime.bigint() - start) / 1e6;
+
+    const boxes = requests.map(req => toBox(req, placements.get(req.name)));
+    const allBoxes = boxes.concat(fixedBoxes);
+    let overlaps = 0;
+    let crossings = 0;
+    for (let i = 0; i < boxes.length; i++) {
+        for (let j = i + 1; j < allBoxes.length; j++) {
+            if (layout.overlapArea(boxes[i].rect, allBoxes[j].rect) > 0) overlaps++;
+            if (layout.segmentsCross(boxes[i].anchor, boxes[i].center, allBoxes[j].anchor, allBoxes[j].center)) crossings++;
+        }
+    }
+    const outOfBounds = boxes.filter(box => box.rect.left < 0 || box.rect.top < 0 ||
+        box.rect.right > bounds.width || box.rect.bottom > bounds.height).length;
+
+    return {
+        name: testCase.name,
+        expect: testCase.expect,
+        placed: placements.size,
+        requested: requests.length,
+        overlaps: overlaps,
+        crossings: crossings,
+        out_of_bounds: outOfBounds,
+        ms: elapsed
+    };
+});
+console.log(JSON.stringify(results));
+"""
+
+
+def run_layout_corpus():
+    """在node中运行全部语料，返回每个场景的统计"""
+    node = shutil.which('node')
+    if node is None:
+        return None
+    output = subprocess.run(
+        [node, '-e', NODE_RUNNER, str(LAYOUT_SCRIPT.resolve()), str(CASES_FILE.resolve())],
+        capture_output=True, text=True, encoding='utf-8', check=True
+    ).stdout
+    return json.loads(output)
+
+
+def check_case(result):
+    """按场景的预期检查统计结果，返回不满足的项"""
+    expect = result['expect']
+    failures = []
+    if result['placed'] != result['requested']:
+        failures.append(f"只放置了 {result['placed']}/{result['requested']} 个信息框")
+    if expect.get('in_bounds') and result['out_of_bounds']:
+        failures.append(f"{result['out_of_bounds']} 个信息框超出容器")
+    if expect.get('no_overlap') and result['overlaps']:
+        failures.append(f"{result['overlaps']} 对信息框重叠")
+    if expect.get('no_crossing') and result['crossings']:
+        failures.append(f"{result['crossings']} 对引线交叉")
+    if 'max_overlaps' in expect and result['overlaps'] > expect['max_overlaps']:
+        failures.append(f"重叠 {result['overlaps']} 对，超过 {expect['max_overlaps']}")
+    if 'max_crossings' in expect and result['crossings'] > expect['max_crossings']:
+        failures.append(f"引线交叉 {result['crossings']} 对，超过 {expect['max_crossings']}")
+    if 'max_ms' in expect and result['ms'] > expect['max_ms']:
+        failures.append(f"耗时 {result['ms']:.1f}ms，超过 {expect['max_ms']}ms")
+    return failures
+
+
+def test_label_layout_corpus():
+    """语料中的每个场景都满足预期"""
+    results = run_layout_corpus()
+    if results is None:
+        import pytest
+        pytest.skip('未安装node')
+
+    failures = {result['name']: check_case(result) for result in results}
+    assert not any(failures.values()), {name: items for name, items in failures.items() if items}
+
+
+if __name__ == "__main__":
+    print("🔄 测试信息框布局引擎...")
+    results = run_layout_corpus()
+    if results is None:
+        print("❌ 未找到node，无法运行测试")
+    else:
+        for result in results:
+            failures = check_case(result)
+            status = "✅" if not failures else "❌"
+            print(f"{status} {result['name']}: {result['requested']} 个信息框, 重叠 {result['overlaps']}, "
+                  f"引线交叉 {result['crossings']}, 耗时 {result['ms']:.1f}ms")
+            for failure in failures:
+                print(f"   - {failure}")
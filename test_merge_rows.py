@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+同一社区多行合并的回归测试
+
+社区在名单中出现多行时，人数和数值列按列求和，姓名、身份证号、序号等列合并为文本，
+只有一行的社区与多行合并的社区使用相同的数值格式。
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import app
+
+ROSTER = '''序号,村居,姓名,身份证号,户号,老年人口,补贴,备注
+1,海达社区,张三,350203195001011234,0101,3人,100.5,低保
+2,海达社区,李四,350203195202021234,0102,2人,200,低保
+3,海达社区,王五,350203195303031234,0101,0,100,特困
+4,石塘村,赵六,350203196004041234,0201,5人,300.0,
+5,贞庵村,钱七,350203197005051234,0301,1人,80,
+'''
+
+
+def parse_roster():
+    """解析测试名单，返回按社区名索引的合并结果和明细行"""
+    parsed = app.parse_community_table(file_data=ROSTER.encode('utf-8'), filename='合并测试.csv')
+    assert parsed is not None
+    return parsed
+
+
+def raw(community, column):
+    return community['columns'][column]['raw_data']
+
+
+def test_duplicate_rows_are_merged():
+    """同一社区的多行合并为一条，人数和数值列求和"""
+    communities = parse_roster()['communities']
+    assert list(communities) == ['海达社区', '石塘村', '贞庵村']
+
+    haida = communities['海达社区']
+    assert haida['row_count'] == 3
+    assert haida['columns']['老年人口']['people_count'] == 5
+    assert raw(haida, '老年人口') == '5人'
+    assert raw(haida, '补贴') == '400.5'
+
+
+def test_text_and_id_columns_are_not_summed():
+    """姓名、身份证号、以0开头的编码和序号列合并为文本，不求和"""
+    haida = parse_roster()['communities']['海达社区']
+    assert raw(haida, '姓名') == '张三、李四、王五'
+    assert raw(haida, '身份证号') == '350203195001011234、350203195202021234、350203195303031234'
+    assert raw(haida, '户号') == '0101、0102'
+    assert raw(haida, '序号') == '1、2、3'
+    assert raw(haida, '备注') == '低保、特困'
+
+
+def test_single_row_numbers_match_merged_format():
+    """只有一行的社区，数值与多行合计的格式一致"""
+    communities = parse_roster()['communities']
+    assert raw(communities['石塘村'], '补贴') == '300'
+    assert raw(communities['贞庵村'], '补贴') == '80'
+    assert raw(communities['石塘村'], '身份证号') == '350203196004041234'
+    assert raw(communities['石塘村'], '户号') == '0201'
+
+
+def test_fractional_and_large_numbers_keep_precision():
+    """小数和大数值不截断有效位数、不使用科学计数法，求和不带浮点误差"""
+    roster = '''村居,补贴,资金,比例
+海达社区,12345.67,1500000.5,0.1
+石塘村,100.25,2400000.75,0.1
+石塘村,2400000.75,99999999999.5,0.2
+'''
+    communities = app.parse_community_table(file_data=roster.encode('utf-8'), filename='精度测试.csv')['communities']
+    assert raw(communities['海达社区'], '补贴') == '12345.67'
+    assert raw(communities['海达社区'], '资金') == '1500000.5'
+    assert raw(communities['石塘村'], '补贴') == '2400101'
+    assert raw(communities['石塘村'], '资金') == '100002400000.25'
+    assert raw(communities['石塘村'], '比例') == '0.3'
+
+
+def test_format_number():
+    """数值格式化：整数不带小数点，小数保留全部有效位数"""
+    assert app.format_number(300.0) == '300'
+    assert app.format_number(-0.0) == '0'
+    assert app.format_number(12345.67) == '12345.67'
+    assert app.format_number(1500000.5) == '1500000.5'
+    assert app.format_number(123456789012.25) == '123456789012.25'
+    assert app.format_number(0.1 + 0.2) == '0.3'
+    assert app.format_number(-2.5) == '-2.5'
+
+
+def test_rows_remain_available_for_drill_down():
+    """合并前的明细行仍可按社区查询"""
+    rows = app.get_community_rows(parse_roster()['rows'], '海达社区', columns=['姓名', '老年人口'])
+    assert rows['row_count'] == 3
+    assert [row['columns']['姓名']['raw_data'] for row in rows['rows']] == ['张三', '李四', '王五']
+    assert [row['columns']['老年人口']['people_count'] for row in rows['rows']] == [3, 2, 0]
+
+
+if __name__ == "__main__":
+    tests = [test_duplicate_rows_are_merged, test_text_and_id_columns_are_not_summed,
+             test_single_row_numbers_match_merged_format, test_fractional_and_large_numbers_keep_precision,
+             test_format_number, test_rows_remain_available_for_drill_down]
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__doc__}")
+        except AssertionError as e:
+            print(f"❌ {test.__doc__}: {e}")
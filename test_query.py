@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+社区查询（/api/query）的测试
+
+过滤、排序和取前k个的结果与逐个社区计算后完整排序的参考结果一致，
+人数相同的社区保持数据中的原始顺序；格式不正确的参数返回400。
+"""
+
+import random
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import app
+
+COLUMNS = ['低保', '特困', '残疾']
+
+
+def make_dataset(community_count=300, seed=7):
+    """生成人数取值范围很小（大量并列）的测试数据集"""
+    rng = random.Random(seed)
+    communities = {}
+    for i in range(community_count):
+        name = f'测试{i:03d}社区'
+        columns = {'村居': {'raw_data': name, 'people_count': 0, 'column_index': 0}}
+        for j, col in enumerate(COLUMNS, start=1):
+            count = rng.randint(0, 5)
+            columns[col] = {'raw_data': f'{count}人', 'people_count': count, 'column_index': j}
+        communities[name] = {'name': name, 'columns': columns, 'detected_column_index': 0}
+    return {'version': 1, 'communities': communities}
+
+
+def reference_query(dataset, filters, columns, sort, order, limit):
+    """逐个社区计算并完整排序的参考实现"""
+    rows = []
+    for position, (name, record) in enumerate(dataset['communities'].items()):
+        counts = {col: record['columns'][col]['people_count'] for col in COLUMNS}
+        counts[app.TOTAL_COLUMN_NAME] = sum(counts[col] for col in columns)
+        if all(app.QUERY_OPERATORS[op](counts[col], value) for col, op, value in filters):
+            rows.append((counts[sort], position, name))
+    sign = -1 if order == 'desc' else 1
+    rows.sort(key=lambda row: (sign * row[0], row[1]))
+    names = [name for _, _, name in rows]
+    return names[:limit] if limit is not None else names
+
+
+def test_filters_and_top_k_match_reference():
+    """过滤和argpartition取前k个的结果与完整排序一致，并列时保持原始顺序"""
+    dataset = make_dataset()
+    cases = [
+        ([], COLUMNS, app.TOTAL_COLUMN_NAME, 'desc', 10),
+        ([], COLUMNS, app.TOTAL_COLUMN_NAME, 'asc', 10),
+        (['低保>2'], COLUMNS, '特困', 'desc', 25),
+        (['低保>=3', '残疾!=0'], ['低保', '特困'], app.TOTAL_COLUMN_NAME, 'asc', 1),
+        (['特困<2人', '残疾=4'], COLUMNS, '低保', 'desc', None),
+        (['低保<=1'], ['残疾'], app.TOTAL_COLUMN_NAME, 'desc', 0),
+        ([f'{app.TOTAL_COLUMN_NAME}>9'], COLUMNS, app.TOTAL_COLUMN_NAME, 'desc', 1000),
+    ]
+    for filter_texts, columns, sort, order, limit in cases:
+        filters = app.parse_query_filters(filter_texts)
+        expected = reference_query(dataset, filters, columns, sort, order, limit)
+        result = app.run_community_query(dataset, filters, columns, sort, order, limit)
+        assert result['names'] == expected, (filter_texts, sort, order, limit)
+        assert [item['rank'] for item in result['communities']] == list(range(1, len(expected) + 1))
+        matched = reference_query(dataset, filters, columns, sort, order, None)
+        assert result['matched'] == len(matched)
+
+
+def test_parse_query_filters():
+    """过滤条件解析为 (列名, 运算符, 人数)，格式不正确时抛出ValueError"""
+    assert app.parse_query_filters(['低保>50', ' 特困 >= 1人', '残疾!=0']) == [
+        ('低保', '>', 50), ('特困', '>=', 1), ('残疾', '!=', 0)]
+    for bad in (['低保'], ['低保>abc'], [['低保>1']], [{'低保': 1}], [5]):
+        try:
+            app.parse_query_filters(bad)
+        except ValueError:
+            continue
+        raise AssertionError(f'应拒绝过滤条件: {bad}')
+
+
+def post_query(payload):
+    """在测试数据集上调用 /api/query"""
+    saved_dataset = app.current_dataset
+    app.current_dataset = make_dataset(community_count=20)
+    try:
+        response = app.app.test_client().post('/api/query', json=payload)
+        return response.status_code, response.get_json()
+    finally:
+        app.current_dataset = saved_dataset
+        app.query_cache.clear()
+
+
+def test_malformed_parameters_return_400():
+    """类型不正确的参数返回400，而不是500"""
+    for payload in ({'columns': [['低保']]}, {'columns': [1, 2]}, {'columns': {'低保': 1}},
+                    {'filters': [['低保>1']]}, {'filters': ['低保>']}, {'filters': ['不存在>1']},
+                    {'sort': ['低保']}, {'sort': '不存在'}, {'limit': [3]}, {'limit': 'abc'},
+                    {'order': 'sideways'}):
+        status, body = post_query(payload)
+        assert status == 400, (payload, status, body)
+        assert 'error' in body
+
+
+def test_well_formed_query():
+    """JSON请求体中的列表和字符串参数均可正常查询"""
+    status, body = post_query({'filters': '低保>=1', 'columns': ['低保', '特困'], 'sort': '低保', 'limit': 3})
+    assert status == 200, body
+    assert body['columns'] == ['低保', '特困']
+    assert len(body['communities']) <= 3
+    assert all(item['counts']['低保'] >= 1 for item in body['communities'])
+
+
+if __name__ == "__main__":
+    tests = [test_filters_and_top_k_match_reference, test_parse_query_filters,
+             test_malformed_parameters_return_400, test_well_formed_query]
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__doc__}")
+        except AssertionError as e:
+            print(f"❌ {test.__doc__}: {e}")
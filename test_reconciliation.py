@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+地图社区名与Excel社区名对照的测试
+
+名单中的社区名常带街道前缀或"居委会"、"村民委员会"等正式后缀，
+标准化后应与地图上的"××社区"、"××村"一致，不依赖n-gram相似度兜底。
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import app
+
+
+def test_normalize_suffix_aliases():
+    """委员会后缀统一为社区/村"""
+    assert app.normalize_community_name('海达居委会') == '海达社区'
+    assert app.normalize_community_name('海达居民委员会') == '海达社区'
+    assert app.normalize_community_name('石塘村委会') == '石塘村'
+    assert app.normalize_community_name('石塘村民委员会') == '石塘村'
+
+
+def test_normalize_official_names_do_not_double_suffix():
+    """已带社区/村后缀的正式名称只去掉委员会部分"""
+    assert app.normalize_community_name('海达社区居委会') == '海达社区'
+    assert app.normalize_community_name('海达社区居民委员会') == '海达社区'
+    assert app.normalize_community_name('石塘村村委会') == '石塘村'
+    assert app.normalize_community_name('石塘村村民委员会') == '石塘村'
+
+
+def test_normalize_prefix_and_whitespace():
+    """去除空白、括号和街道/镇前缀"""
+    assert app.normalize_community_name(' 海达 社区 ') == '海达社区'
+    assert app.normalize_community_name('海沧街道海达社区居委会') == '海达社区'
+    assert app.normalize_community_name('东孚镇贞庵村村民委员会') == '贞庵村'
+    # 去掉前缀后不含社区/村关键词时保留原名
+    assert app.normalize_community_name('海沧街道') == '海沧街道'
+
+
+def test_official_names_match_as_normalized():
+    """带正式后缀的Excel社区名在标准化阶段匹配"""
+    index = app.build_reconciliation_index(
+        ['海达社区', '石塘村', '贞庵村'],
+        ['海达社区居委会', '石塘村村民委员会', '东孚镇贞庵村委会'])
+    assert index['data_to_map'] == {'海达社区居委会': '海达社区', '石塘村村民委员会': '石塘村',
+                                    '东孚镇贞庵村委会': '贞庵村'}
+    for match in index['matches'].values():
+        assert match['method'] == 'normalized'
+        assert match['score'] == 0.95
+    assert index['unmatched_map'] == []
+    assert index['unmatched_data'] == []
+
+
+def test_match_stages():
+    """精确匹配优先，其次社区/村主体匹配，最后n-gram相似度匹配"""
+    index = app.build_reconciliation_index(['海达社区', '钟山村', '新垵社区'], ['海达社区', '钟山社区', '新垵村居'])
+    assert index['matches']['海达社区'] == {'data_name': '海达社区', 'method': 'exact', 'score': 1.0}
+    assert index['matches']['钟山村'] == {'data_name': '钟山社区', 'method': 'normalized', 'score': 0.9}
+    assert index['matches']['新垵社区']['method'] == 'ngram'
+    assert index['matches']['新垵社区']['data_name'] == '新垵村居'
+
+
+def test_each_data_name_matches_once():
+    """每个Excel社区最多对应一个地图社区，匹配不上的分别列出"""
+    index = app.build_reconciliation_index(['海达社区', '海达村', '石塘村'], ['海达社区', '未知名称'])
+    assert index['data_to_map'] == {'海达社区': '海达社区'}
+    assert index['unmatched_map'] == ['海达村', '石塘村']
+    assert index['unmatched_data'] == ['未知名称']
+
+
+if __name__ == "__main__":
+    tests = [test_normalize_suffix_aliases, test_normalize_official_names_do_not_double_suffix,
+             test_normalize_prefix_and_whitespace, test_official_names_match_as_normalized,
+             test_match_stages, test_each_data_name_matches_once]
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__doc__}")
+        except AssertionError as e:
+            print(f"❌ {test.__doc__}: {e}")